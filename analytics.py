@@ -0,0 +1,309 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+TRANSACTION_TYPES = ('Income', 'Expense', 'Bill', 'Debt', 'Savings', 'Withdrawal')
+OUTFLOW_TYPES = ('Expense', 'Bill', 'Debt', 'Withdrawal')
+
+
+def _as_date(day):
+    return day.date() if isinstance(day, datetime) else day
+
+
+def parse_dates(values, date_format=None):
+    """Parses date strings to datetime64, NaT where unparseable.
+
+    With ``date_format`` the format is enforced. Otherwise the stored ISO
+    'YYYY-MM-DD' form goes through an explicit-format fast path and only the
+    rows that miss it pay for per-value format inference.
+    """
+    if date_format:
+        return pd.to_datetime(values, format=date_format, errors='coerce')
+    parsed = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], format='mixed', errors='coerce')
+    return parsed
+
+
+def period_window(time_range, today=None):
+    """Maps a fixed "Time Period" option to (start, end, view_days).
+
+    Bounds are inclusive dates; None means the window is open on that side.
+    """
+    today = _as_date(today or datetime.today())
+    if time_range == "Today":
+        return today, today, 1.0
+    if time_range == "Yesterday":
+        day = today - timedelta(days=1)
+        return day, day, 1.0
+    if time_range == "This Week":
+        return today - timedelta(days=today.weekday()), None, 7.0
+    if time_range == "This Month":
+        start, end = month_window(today.year, today.month)
+        return start, end, 30.0
+    if time_range == "This Year":
+        return date(today.year, 1, 1), date(today.year, 12, 31), 365.0
+    # All Time
+    return None, None, 30.0
+
+
+def month_window(year, month):
+    """First and last day of the given month."""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def bucket_freq(days):
+    """Chart granularity for a view spanning ``days``: daily, weekly or monthly bars."""
+    if days <= 31:
+        return 'D'
+    if days <= 183:
+        return 'W'
+    return 'M'
+
+
+def activity_trend(rollup, days=None, types=('Income', 'Expense', 'Withdrawal')):
+    """Sums daily_rollup rows per (bucket, type) for the Activity chart.
+
+    ``days`` picks the bucket size; when None (open-ended views) the span of
+    the data is used. Buckets keep their real dates so different years never
+    merge, and labels are formatted once per bucket rather than once per row.
+    """
+    rows = rollup[rollup['type'].isin(types)]
+    if rows.empty:
+        return pd.DataFrame(columns=['bucket', 'label', 'type', 'amount'])
+    if days is None:
+        days = (rows['day'].max() - rows['day'].min()).days + 1
+    freq = bucket_freq(days)
+    if freq == 'D':
+        bucket = rows['day']
+    elif freq == 'W':
+        bucket = rows['day'] - pd.to_timedelta(rows['day'].dt.weekday, unit='D')
+    else:
+        bucket = rows['day'].dt.to_period('M').dt.start_time
+    trend = (
+        rows.assign(bucket=bucket)
+        .groupby(['bucket', 'type'], as_index=False, observed=True)['total'].sum()
+        .rename(columns={'total': 'amount'})
+        .sort_values('bucket')
+    )
+    multi_year = trend['bucket'].dt.year.nunique() > 1
+    fmt = {'D': '%b %d', 'W': 'Wk %b %d', 'M': '%b %Y'}[freq]
+    if multi_year and freq != 'M':
+        fmt += ' %Y'
+    labels = {b: b.strftime(fmt) for b in trend['bucket'].unique()}
+    trend['label'] = trend['bucket'].map(labels)
+    return trend[['bucket', 'label', 'type', 'amount']]
+
+
+def totals_by(rollup, key, types=None):
+    """Sums rollup totals per ``key`` column, optionally restricted to ``types``."""
+    rows = rollup if types is None else rollup[rollup['type'].isin(types)]
+    return rows.groupby(key, observed=True)['total'].sum()
+
+
+# Days in each goal period, used to normalize a goal to a daily rate
+GOAL_PERIOD_DAYS = {'Daily': 1.0, 'Monthly': 30.0, 'Yearly': 365.0}
+
+GOAL_COLORS = {'over': "#FF453A", 'warn': "#FFD60A", 'ok': "#30D158"}
+
+
+def goal_progress(goals, spent_by_category, view_days):
+    """Evaluates every goal against the spend for the current view in one pass.
+
+    ``goals`` has category/amount/period columns (as returned by get_goals);
+    ``spent_by_category`` is outflow per category for the view. Each goal is
+    normalized to a daily rate and scaled to ``view_days``. Returns one row
+    per goal with limit, spent, ratio, pct (capped at 100) and bar color.
+    """
+    out = goals[['category', 'amount']].copy()
+    period = goals['period'] if 'period' in goals else pd.Series('Monthly', index=goals.index)
+    out['period'] = period.fillna('Monthly')
+    period_days = out['period'].map(GOAL_PERIOD_DAYS).fillna(GOAL_PERIOD_DAYS['Monthly'])
+    out['limit'] = out['amount'] / period_days * view_days
+    out['spent'] = out['category'].map(spent_by_category).fillna(0.0).astype(float)
+    limit = out['limit'].to_numpy(dtype=float)
+    spent = out['spent'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(limit > 0, spent / limit, 0.0)
+    out['ratio'] = ratio
+    out['pct'] = np.minimum(ratio * 100, 100)
+    out['color'] = np.select(
+        [ratio >= 1.0, ratio >= 0.75],
+        [GOAL_COLORS['over'], GOAL_COLORS['warn']],
+        default=GOAL_COLORS['ok'],
+    )
+    return out.reset_index(drop=True)
+
+
+# Types whose repeats are commitments worth projecting forward
+RECURRING_TYPES = ('Income', 'Bill', 'Debt')
+# A series needs this many occurrences before it counts as recurring...
+RECURRING_MIN_OCCURRENCES = 3
+# ...and this share of its gaps within tolerance of its typical interval:
+# RECURRING_TOLERANCE of the interval, but never tighter than RECURRING_SLACK_DAYS
+RECURRING_REGULAR_SHARE = 0.75
+RECURRING_TOLERANCE = 0.2
+RECURRING_SLACK_DAYS = 3
+# Intervals this close (in days) to a whole number of months repeat on calendar months
+DAYS_PER_MONTH = 365.25 / 12
+FORECAST_HORIZONS = (3, 6, 12)
+
+RECURRING_COLUMNS = ['type', 'category', 'amount', 'interval_days', 'interval_months', 'occurrences', 'last', 'next']
+
+
+def _advance(last, interval_days, interval_months, k):
+    """The k-th repeat after ``last`` (datetime64[D] arrays), on calendar months where interval_months > 0.
+
+    Month steps keep the day of month, clamped to the target month's length,
+    so a bill paid on the 31st lands on Feb 28 without drifting afterwards.
+    """
+    by_days = last + np.round(k * interval_days).astype(np.int64).astype('timedelta64[D]')
+    month0 = last.astype('datetime64[M]')
+    day_of_month = last - month0.astype('datetime64[D]')
+    target = month0 + (k * interval_months).astype(np.int64).astype('timedelta64[M]')
+    month_len = (target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')
+    by_months = target.astype('datetime64[D]') + np.minimum(day_of_month, month_len - 1)
+    return np.where(interval_months > 0, by_months, by_days)
+
+
+def detect_recurring(tx, today=None):
+    """Finds Income/Bill/Debt series repeating with the same category and amount at a regular interval.
+
+    ``tx`` has type, category, amount and date (datetime64) columns. Rows are
+    sorted once by (type, category, amount in cents, day) and every gap is
+    compared with its series' median in array operations, with no per-series
+    Python loop. A series that has missed two repeats in a row is treated as
+    ended. Returns one row per series with its interval, last and next dates.
+    """
+    today = np.datetime64(_as_date(today or datetime.today()), 'D')
+    rows = tx[tx['type'].isin(RECURRING_TYPES)]
+    if rows.empty:
+        return pd.DataFrame(columns=RECURRING_COLUMNS)
+    type_code, type_names = pd.factorize(rows['type'])
+    cat_code, cat_names = pd.factorize(rows['category'], use_na_sentinel=False)
+    cents = np.round(rows['amount'].to_numpy(dtype=float) * 100).astype(np.int64)
+    cent_code, cent_values = pd.factorize(cents)
+    day = rows['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # One int64 sort key, series then day, instead of a four-key lexsort
+    series_code, series_keys = pd.factorize((type_code * len(cat_names) + cat_code) * len(cent_values) + cent_code)
+    span = int(day.max() - day.min()) + 1
+    key = np.sort(series_code.astype(np.int64) * span + (day - day.min()))
+    # Same-day repeats count once
+    key = key[np.r_[True, key[1:] != key[:-1]]]
+    code, day = key // span, key % span + day.min()
+
+    starts = np.r_[True, code[1:] != code[:-1]]
+    series_id = np.cumsum(starts) - 1
+    gap = np.where(starts, np.nan, np.r_[0, np.diff(day)].astype(float))
+
+    typical = pd.Series(gap).groupby(series_id).median().to_numpy()
+    tolerance = np.maximum(typical * RECURRING_TOLERANCE, RECURRING_SLACK_DAYS)
+    regular = np.abs(gap - typical[series_id]) <= tolerance[series_id]
+    occurrences = np.bincount(series_id)
+    regular_gaps = np.bincount(series_id, weights=regular)
+    first = np.flatnonzero(starts)
+    last_row = np.r_[first[1:], len(day)] - 1
+    found = (occurrences >= RECURRING_MIN_OCCURRENCES) & (typical >= 1) & (regular_gaps >= (occurrences - 1) * RECURRING_REGULAR_SHARE)
+
+    interval = typical[found]
+    months = np.round(interval / DAYS_PER_MONTH)
+    interval_months = np.where((months >= 1) & (np.abs(interval - months * DAYS_PER_MONTH) <= RECURRING_SLACK_DAYS), months, 0).astype(np.int64)
+    last = day[last_row[found]].astype('datetime64[D]')
+    active = today < _advance(last, interval, interval_months, 2)
+
+    pair, cent_of = np.divmod(series_keys[code[first[found]]], len(cent_values))
+    type_of, cat_of = np.divmod(pair, len(cat_names))
+    out = pd.DataFrame({
+        'type': np.asarray(type_names, dtype=object)[type_of],
+        'category': np.asarray(cat_names, dtype=object)[cat_of],
+        'amount': cent_values[cent_of] / 100,
+        'interval_days': interval,
+        'interval_months': interval_months,
+        'occurrences': occurrences[found],
+        'last': pd.to_datetime(last),
+        'next': pd.to_datetime(_advance(last, interval, interval_months, 1)),
+    })[active]
+    return out.sort_values(['type', 'amount'], ascending=[True, False], ignore_index=True)
+
+
+def project_cash_flow(recurring, goals, balance, months=6, today=None, scheduled=None):
+    """Projects ``balance`` over this month and the next ``months - 1`` from recurring series and goals.
+
+    Every future repeat of every series is expanded at once with np.repeat
+    (overdue ones land today) and summed per month with np.bincount. Repeats
+    start after a series' last recorded row, so rows already entered for
+    future dates are not projected twice: pass them as ``scheduled`` (type,
+    category, amount, date) and they land in their own months, with
+    ``balance`` taken as of today, i.e. without them. Goals
+    are budgets: a goal's monthly limit is first consumed by the recurring
+    bills in its category, and only the rest is projected as extra spend.
+    Returns a dict of frames: 'months' (income, outflow, goal_budget, net,
+    balance, balance_after_goals per month), 'goals' (average monthly limit
+    and committed spend per goal) and 'recurring' as passed in.
+    """
+    today = np.datetime64(_as_date(today or datetime.today()), 'D')
+    first = today.astype('datetime64[M]')
+    month_starts = first + np.arange(months)
+    end = (first + months).astype('datetime64[D]')
+    month_days = ((month_starts + 1).astype('datetime64[D]') - month_starts.astype('datetime64[D]')).astype(float)
+
+    n = len(recurring)
+    interval = recurring['interval_days'].to_numpy(dtype=float)
+    interval_months = recurring['interval_months'].to_numpy(dtype=np.int64)
+    last = recurring['last'].to_numpy().astype('datetime64[D]')
+    # Enough repeats per series to pass the horizon (months are at least 28 days); extras are dropped below
+    step = np.where(interval_months > 0, interval_months * 28.0, np.maximum(interval, 1.0))
+    # Series recorded past the horizon already have every repeat inside it as a scheduled row
+    reps = np.maximum(np.ceil((end - last).astype(float) / step).astype(np.int64) + 1, 0) if n else np.zeros(0, np.int64)
+    idx = np.repeat(np.arange(n), reps)
+    k = np.arange(len(idx)) - np.repeat(np.cumsum(reps) - reps, reps) + 1
+    due = _advance(last[idx], interval[idx], interval_months[idx], k)
+    inside = due < end
+    idx, due = idx[inside], np.maximum(due[inside], today)
+    bucket = (due.astype('datetime64[M]') - first).astype(np.int64)
+    amount = recurring['amount'].to_numpy(dtype=float)[idx]
+    kind = np.asarray(recurring['type'], dtype=object)[idx]
+    category = np.asarray(recurring['category'], dtype=object)[idx]
+    if scheduled is not None and len(scheduled):
+        day = scheduled['date'].to_numpy().astype('datetime64[D]')
+        ahead = (day > today) & (day < end)
+        bucket = np.concatenate([bucket, (day[ahead].astype('datetime64[M]') - first).astype(np.int64)])
+        amount = np.concatenate([amount, scheduled['amount'].to_numpy(dtype=float)[ahead]])
+        kind = np.concatenate([kind, np.asarray(scheduled['type'], dtype=object)[ahead]])
+        category = np.concatenate([category, np.asarray(scheduled['category'], dtype=object)[ahead]])
+    is_income = kind == 'Income'
+    income = np.bincount(bucket, weights=np.where(is_income, amount, 0.0), minlength=months).astype(float)
+    outflow = np.bincount(bucket, weights=np.where(is_income, 0.0, amount), minlength=months).astype(float)
+
+    g = len(goals)
+    period = goals['period'].fillna('Monthly') if 'period' in goals else pd.Series('Monthly', index=goals.index)
+    daily = goals['amount'].to_numpy(dtype=float) / period.map(GOAL_PERIOD_DAYS).fillna(GOAL_PERIOD_DAYS['Monthly']).to_numpy(dtype=float)
+    limit = np.outer(daily, month_days)
+    goal_of = pd.Index(goals['category']).get_indexer(category) if g else np.full(len(amount), -1)
+    counted = (goal_of >= 0) & ~is_income
+    committed = np.bincount(
+        goal_of[counted] * months + bucket[counted], weights=amount[counted], minlength=g * months,
+    ).reshape(g, months)
+    goal_budget = np.maximum(limit - committed, 0.0).sum(axis=0)
+
+    net = income - outflow
+    projected = pd.DataFrame({
+        'month': pd.to_datetime(month_starts),
+        'income': income,
+        'outflow': outflow,
+        'goal_budget': goal_budget,
+        'net': net,
+        'balance': balance + np.cumsum(net),
+        'balance_after_goals': balance + np.cumsum(net - goal_budget),
+    })
+    consumed = pd.DataFrame({
+        'category': goals['category'].to_numpy(),
+        'limit': limit.sum(axis=1) / months,
+        'committed': committed.sum(axis=1) / months,
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        consumed['share'] = np.where(consumed['limit'] > 0, consumed['committed'] / consumed['limit'], 0.0)
+    return {'months': projected, 'goals': consumed, 'recurring': recurring}
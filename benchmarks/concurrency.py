@@ -0,0 +1,168 @@
+"""Write throughput as the number of shards grows, and with group commit.
+
+Usage: python benchmarks/concurrency.py [--workers 8] [--writes 500] [--shards 1 2 4 8] [--sessions 16]
+
+Shards: each worker is its own process (one app server per tenant, in
+effect) writing as a different user through db.add_transaction, one
+transaction per write. With one shard every worker queues on the same
+SQLite write lock; with K shards the users spread over K files and up to K
+commits run at once, so writes/s should climb until the workers or the
+disk run out.
+
+Sessions: ``--sessions`` threads in one process (one per browser session)
+add rows inline, each its own commit, and then through the background
+writer, which commits whatever the sessions queued together.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from sharding import split_database  # noqa: E402
+
+
+def _configure(path, shards, write_behind=False):
+    db.DB_FILE = path
+    db.SHARDS = shards
+    db.WRITE_BEHIND = write_behind
+    db.init_db()
+
+
+def _register(count):
+    users = []
+    for i in range(count):
+        db.register_user(f"writer_{i}", 'bench')
+        users.append(db.login_user(f"writer_{i}", 'bench')[0])
+    return users
+
+
+def _summary(samples, elapsed):
+    samples = sorted(samples)
+    return {
+        'writes_per_s': len(samples) / elapsed,
+        'median_ms': statistics.median(samples),
+        'p99_ms': samples[min(len(samples) - 1, int(round(0.99 * (len(samples) - 1))))],
+    }
+
+
+def _drop(workdir):
+    for pool_path in list(db._pools):
+        if pool_path.startswith(workdir):
+            db._pools.pop(pool_path).close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _worker(path, shards, user_id, writes, start, results):
+    _configure(path, shards)
+    start.wait()
+    samples = []
+    for i in range(writes):
+        t0 = time.perf_counter()
+        db.add_transaction(user_id, 'Expense', 'Food', 1.0 + i % 50, '2024-01-01', f"bench {i}")
+        samples.append((time.perf_counter() - t0) * 1000)
+    results.put((samples, time.perf_counter(), db.user_pool(user_id).stats()['busy_errors']))
+
+
+def run(shards, workers, writes):
+    """Runs ``workers`` concurrent writers over a fresh ``shards``-way database."""
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'bench.db')
+        _configure(path, 0)
+        users = _register(workers)
+        if shards:
+            split_database(path, shards)
+            _configure(path, shards)
+
+        # spawn, not fork: children must not inherit this process's pooled connections
+        ctx = multiprocessing.get_context('spawn')
+        start, results = ctx.Barrier(workers + 1), ctx.Queue()
+        procs = [ctx.Process(target=_worker, args=(path, shards, uid, writes, start, results)) for uid in users]
+        for p in procs:
+            p.start()
+        start.wait()
+        t0 = time.perf_counter()
+        done = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = max(end for _, end, _ in done) - t0
+        return {
+            'shards': shards,
+            'files_used': len({db.shard_path(uid, path, shards) for uid in users}),
+            **_summary([s for run_samples, _, _ in done for s in run_samples], elapsed),
+            'busy_errors': sum(busy for _, _, busy in done),
+        }
+    finally:
+        _drop(workdir)
+
+
+def run_sessions(sessions, writes, write_behind):
+    """``sessions`` threads in this process, each adding ``writes`` rows as its own user."""
+    workdir = tempfile.mkdtemp()
+    try:
+        _configure(os.path.join(workdir, 'bench.db'), 0, write_behind)
+        users = _register(sessions)
+        before = db.writer_stats()
+        start = threading.Barrier(sessions + 1)
+        samples = []
+
+        def session(user_id):
+            start.wait()
+            mine = []
+            for i in range(writes):
+                t0 = time.perf_counter()
+                db.add_transaction(user_id, 'Expense', 'Food', 1.0 + i % 50, '2024-01-01', f"bench {i}")
+                mine.append((time.perf_counter() - t0) * 1000)
+            samples.extend(mine)
+
+        threads = [threading.Thread(target=session, args=(uid,)) for uid in users]
+        for t in threads:
+            t.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        after = db.writer_stats()
+        batches = after.get('batches', 0) - before.get('batches', 0)
+        return {
+            'mode': 'write-behind' if write_behind else 'inline',
+            **_summary(samples, elapsed),
+            'avg_batch': len(samples) / batches if batches else 1.0,
+        }
+    finally:
+        _drop(workdir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=500, help="per worker")
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sessions', type=int, default=16, help="threads for the group-commit comparison; 0 skips it")
+    args = parser.parse_args()
+
+    print(f"{args.workers} writers x {args.writes} writes")
+    print(f"{'shards':>6} {'files':>6} {'writes/s':>10} {'median ms':>10} {'p99 ms':>8} {'busy':>5}")
+    baseline = None
+    for k in args.shards:
+        r = run(k, args.workers, args.writes)
+        baseline = baseline or r['writes_per_s']
+        print(f"{r['shards']:>6} {r['files_used']:>6} {r['writes_per_s']:>10,.0f} {r['median_ms']:>10.2f} "
+              f"{r['p99_ms']:>8.2f} {r['busy_errors']:>5}  x{r['writes_per_s'] / baseline:.2f}")
+
+    if args.sessions:
+        print(f"\n{args.sessions} sessions x {args.writes} writes in one process")
+        print(f"{'mode':>12} {'writes/s':>10} {'median ms':>10} {'p99 ms':>8} {'batch':>6}")
+        for write_behind in (False, True):
+            r = run_sessions(args.sessions, args.writes, write_behind)
+            print(f"{r['mode']:>12} {r['writes_per_s']:>10,.0f} {r['median_ms']:>10.2f} {r['p99_ms']:>8.2f} {r['avg_batch']:>6.1f}")
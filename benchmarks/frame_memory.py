@@ -0,0 +1,60 @@
+"""Memory and latency of the typed transaction frame vs. the original loader.
+
+Usage: python benchmarks/frame_memory.py [--rows 100000 1000000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from analytics import OUTFLOW_TYPES  # noqa: E402
+import generate  # noqa: E402
+
+
+def legacy_frame(path, user_id):
+    # The loader as it was: SELECT *, format-less parse, object columns
+    with sqlite3.connect(path) as conn:
+        df = pd.read_sql_query("SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC", conn, params=(user_id,))
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df.dropna(subset=['date'])
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def compare(rows):
+    generate.populate(os.path.join(tempfile.mkdtemp(), 'bench.db'), 1, rows)
+
+    old, old_load = timed(lambda: legacy_frame(db.DB_FILE, 1))
+    new, new_load = timed(lambda: db.get_transactions.uncached(1))
+    _, old_mask = timed(lambda: (old['type'] == 'Income', old['type'].isin(list(OUTFLOW_TYPES)), old['type'] == 'Savings'), 5)
+    # The same comparisons typed_frame() runs once per load, on its categorical column
+    _, new_mask = timed(lambda: (new['type'] == 'Income', new['type'].isin(OUTFLOW_TYPES), new['type'] == 'Savings'), 5)
+
+    old_mb = old.memory_usage(deep=True).sum() / 2**20
+    new_mb = new.memory_usage(deep=True).sum() / 2**20
+    print(f"\n{rows:,} rows")
+    print(f"  {'':<14}{'legacy':>12}{'typed':>12}")
+    print(f"  {'memory (MB)':<14}{old_mb:>12.1f}{new_mb:>12.1f}")
+    print(f"  {'load (ms)':<14}{old_load * 1000:>12.1f}{new_load * 1000:>12.1f}")
+    print(f"  {'masks (ms)':<14}{old_mask * 1000:>12.2f}{new_mask * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    for n in parser.parse_args().rows:
+        compare(n)
@@ -0,0 +1,118 @@
+"""Synthetic multi-user data for benchmarks.
+
+Usage: python benchmarks/generate.py --users 20 --transactions 50000 [--db budget_v3.db]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from cache import invalidate  # noqa: E402
+
+# Share of transactions per type and (median, spread) of a lognormal amount
+TYPE_MIX = {
+    'Expense': (0.70, 25.0, 0.9),
+    'Bill': (0.10, 90.0, 0.6),
+    'Income': (0.07, 2200.0, 0.4),
+    'Savings': (0.06, 150.0, 0.7),
+    'Debt': (0.04, 250.0, 0.6),
+    'Withdrawal': (0.03, 60.0, 0.5),
+}
+
+# Mirrors the pickers in the New Transaction form, most common first
+CATEGORIES = {
+    'Expense': ["Food", "Shopping", "Transport", "Entertainment", "Health", "Personal", "Travel", "Education", "Other"],
+    'Bill': ["Rent", "Utilities", "Internet", "Phone", "Subscription", "Insurance", "Gym"],
+    'Income': ["Salary", "Freelance", "Investment", "Business", "Gift"],
+    'Savings': ["Emergency Fund", "Retirement", "Vacation", "Home", "Car", "General"],
+    'Debt': ["Credit Card", "Loan", "Mortgage"],
+    'Withdrawal': ["Cash"],
+}
+
+MERCHANTS = ["Starbucks", "Amazon", "Uber", "Walmart", "Shell", "Netflix", "Target", "Whole Foods", "Spotify", "Landlord", "Employer"]
+
+
+def _zipf_weights(n):
+    w = 1.0 / np.arange(1, n + 1)
+    return w / w.sum()
+
+
+def user_transactions(rng, n, end=None, years=5):
+    """A frame of ``n`` transactions spread over ``years``, denser toward recent dates."""
+    end = pd.Timestamp(end or pd.Timestamp.today().normalize())
+    span = int(365 * years)
+    types = np.array(list(TYPE_MIX))
+    share = np.array([TYPE_MIX[t][0] for t in types])
+    type_col = types[rng.choice(len(types), n, p=share / share.sum())]
+
+    category = np.empty(n, dtype=object)
+    amount = np.empty(n)
+    for t in types:
+        idx = np.flatnonzero(type_col == t)
+        cats = CATEGORIES[t]
+        category[idx] = np.array(cats)[rng.choice(len(cats), len(idx), p=_zipf_weights(len(cats)))]
+        median, spread = TYPE_MIX[t][1], TYPE_MIX[t][2]
+        amount[idx] = np.round(rng.lognormal(np.log(median), spread, len(idx)), 2)
+
+    # Triangular-ish skew: more activity in recent months
+    offsets = (span * (1 - np.sqrt(rng.random(n)))).astype(int)
+    dates = (end - pd.to_timedelta(offsets, unit='D')).strftime('%Y-%m-%d')
+    merchant = np.array(MERCHANTS)[rng.integers(0, len(MERCHANTS), n)]
+    description = pd.Series(merchant) + ' #' + pd.Series(rng.integers(100, 999, n)).astype(str)
+    return pd.DataFrame({
+        'type': type_col,
+        'category': category,
+        'amount': amount,
+        'date': dates,
+        'description': description.to_numpy(dtype=object),
+    })
+
+
+def populate(path, users, transactions, seed=0, years=5, prefix='bench_user'):
+    """Creates ``users`` users with ``transactions`` rows each; returns their ids."""
+    db.DB_FILE = path
+    db.init_db()
+    rng = np.random.default_rng(seed)
+    user_ids = []
+    for i in range(users):
+        name = f"{prefix}_{i}"
+        db.register_user(name, 'bench')
+        user_ids.append(db.login_user(name, 'bench')[0])
+
+    for uid in user_ids:
+        df = user_transactions(rng, transactions, years=years)
+        with db.user_pool(uid).transaction() as conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)",
+                zip([uid] * len(df), df['type'].tolist(), df['category'].tolist(), df['amount'].tolist(), df['date'].tolist(), df['description'].tolist()),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO goals (user_id, category, amount, period) VALUES (?, ?, ?, ?)",
+                [(uid, 'Food', 400.0, 'Monthly'), (uid, 'Shopping', 10.0, 'Daily'), (uid, 'Travel', 3000.0, 'Yearly')],
+            )
+        invalidate(uid)
+    for target in db.db_paths(path):
+        with db.get_pool(target).connection() as conn:
+            conn.execute("ANALYZE")
+    return user_ids
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=db.DB_FILE)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=10000, help="per user")
+    parser.add_argument('--years', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    ids = populate(args.db, args.users, args.transactions, args.seed, args.years)
+    print(f"{len(ids)} users x {args.transactions:,} transactions -> {args.db} in {time.perf_counter() - t0:.1f}s "
+          f"(password 'bench')")
@@ -0,0 +1,219 @@
+"""Benchmark the data layer and full dashboard reruns, writing comparable JSON.
+
+Usage:
+    python benchmarks/run.py --users 5 --transactions 20000 --out bench_results.json
+    python benchmarks/run.py --db existing.db --compare bench_results.json
+    python benchmarks/run.py --startup-runs 5 --skip-pages
+    python benchmarks/run.py --engine parquet --compare bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from analytics import OUTFLOW_TYPES  # noqa: E402
+from cache import get_cache  # noqa: E402
+import generate  # noqa: E402
+import startup  # noqa: E402
+
+TIME_PERIODS = ["This Month", "All Time", "Today", "Yesterday", "This Week", "This Year", "Custom Range"]
+# A change larger than this (either way) is flagged by --compare
+THRESHOLD = 0.10
+# ...and by more than this, so sub-millisecond noise isn't reported
+MIN_DELTA_MS = 0.05
+
+
+def measure(fn, repeat=10, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'min_ms': samples[0],
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        'runs': len(samples),
+    }
+
+
+def micro(user_id, repeat):
+    """Times every data function; readers are timed uncached (DB cost) and cached (hit cost)."""
+    today = date.today()
+    month = (today.replace(day=1), today)
+    readers = {
+        'get_transactions[all]': lambda f: f(user_id),
+        'get_transactions[month]': lambda f: f(user_id, *month),
+        'get_rollup[all]': lambda f: f(user_id),
+        'get_rollup[month]': lambda f: f(user_id, *month),
+        'get_totals': lambda f: f(user_id),
+        'get_user_categories': lambda f: f(user_id),
+        'get_categories[one type]': lambda f: f(user_id, ('Expense',)),
+        'get_categories[outflow]': lambda f: f(user_id, OUTFLOW_TYPES),
+        'get_goals': lambda f: f(user_id),
+        'get_transactions_page': lambda f: f(user_id, page_size=50),
+        'search_transactions[word]': lambda f: f(user_id, 'starbucks'),
+        'search_transactions[prefix]': lambda f: f(user_id, 'star*'),
+        'search_transactions[month]': lambda f: f(user_id, 'amazon', *month),
+        'count_transactions[month]': lambda f: f(user_id, *month),
+        'get_recurring': lambda f: f(user_id),
+        # uncached here still reuses the cached get_recurring, i.e. the projection alone
+        'get_forecast[12]': lambda f: f(user_id, 12),
+    }
+    results = {}
+    for name, call in readers.items():
+        fn = getattr(db, name.split('[')[0])
+        results[name] = measure(lambda: call(fn.uncached), repeat)
+        results[name + ' (cached)'] = measure(lambda: call(fn), repeat)
+
+    results['login_user'] = measure(lambda: db.login_user('bench_user_0', 'bench'), repeat)
+    results['set_goal'] = measure(lambda: db.set_goal(user_id, 'Food', 400.0, 'Monthly'), repeat)
+    results['add_transaction'] = measure(lambda: db.add_transaction(user_id, 'Expense', 'Bench', 1.0, today, 'bench'), repeat)
+    results['add_transaction_if_funds'] = measure(lambda: db.add_transaction_if_funds(user_id, 'Expense', 'Bench', 0.01, today, 'bench'), repeat)
+    results['delete_transactions_range[empty]'] = measure(lambda: db.delete_transactions_range(user_id, date(1990, 1, 1), date(1990, 1, 2)), repeat)
+    results['delete_transactions_category'] = measure(lambda: db.delete_transactions_category(user_id, 'Bench'), 1, warmup=0)
+    return results
+
+
+def pages(user_id, repeat):
+    """Full-page reruns through AppTest for each Time Period, cold (empty cache) and warm."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, 'streamlit_app.py'), default_timeout=120)
+    at.session_state.user_id = user_id
+    at.session_state.username = 'bench_user_0'
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    results = {}
+    for period in TIME_PERIODS:
+        [s for s in at.selectbox if s.label == "Time Period"][0].set_value(period)
+
+        def rerun():
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+
+        def cold():
+            get_cache().clear()
+            rerun()
+
+        results[f"{period} (cold)"] = measure(cold, repeat)
+        results[f"{period} (warm)"] = measure(rerun, repeat)
+    return results
+
+
+def cold_starts(runs):
+    """Login page first paint in fresh processes (see benchmarks/startup.py)."""
+    samples = [startup.cold_start() for _ in range(runs)]
+    results = {f"login {key}": summarize([s[key] for s in samples]) for key in ('wall_ms', 'first_run_ms')}
+    heavy = sorted({m for s in samples for m in s['heavy_modules']})
+    if heavy:
+        print(f"warning: login path imported {', '.join(heavy)}")
+    return results
+
+
+def compare(current, baseline_path, threshold=THRESHOLD):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = 0
+    print(f"\n{'benchmark':<52}{'base ms':>10}{'now ms':>10}{'change':>9}")
+    for section in ('micro', 'pages', 'startup'):
+        for name, stats in current.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            before, after = old['median_ms'], stats['median_ms']
+            change = (after - before) / before if before else 0.0
+            flag = ''
+            if abs(after - before) < MIN_DELTA_MS:
+                pass
+            elif change > threshold:
+                flag = '  << slower'
+                regressions += 1
+            elif change < -threshold:
+                flag = '  faster'
+            print(f"{section + ':' + name:<52}{before:>10.2f}{after:>10.2f}{change:>+9.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help="benchmark an existing database instead of generating one")
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=20000, help="per generated user")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--skip-pages', action='store_true', help="data functions only (no AppTest)")
+    parser.add_argument('--startup-runs', type=int, default=3, help="cold-process login renders; 0 skips them")
+    parser.add_argument('--engine', choices=['sqlite', 'parquet', 'duckdb'], default=db.ANALYTICS_ENGINE, help="where get_rollup aggregates")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', help="baseline JSON to diff against; exits 1 on regressions")
+    args = parser.parse_args()
+
+    if args.db:
+        db.DB_FILE = args.db
+        db.init_db()
+        user_id = db.login_user('bench_user_0', 'bench')
+        if not user_id:
+            parser.error("--db must have been filled by benchmarks/generate.py (needs bench_user_0)")
+        user_id = user_id[0]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        user_id = generate.populate(path, args.users, args.transactions, args.seed)[0]
+
+    db.ANALYTICS_ENGINE = args.engine
+    if args.engine != 'sqlite':
+        import columnar
+        columnar.MIRROR_DIR = os.path.join(os.path.dirname(os.path.abspath(db.DB_FILE)), 'analytics_mirror')
+
+    results = {
+        'meta': {
+            'when': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'db': db.DB_FILE,
+            'engine': args.engine,
+            'user_rows': db.get_totals.uncached(user_id)['count'],
+            'users': args.users if not args.db else None,
+        },
+        'micro': micro(user_id, args.repeat),
+    }
+    if not args.skip_pages:
+        results['pages'] = pages(user_id, max(1, args.repeat // 2))
+    if args.startup_runs:
+        results['startup'] = cold_starts(args.startup_runs)
+    results['meta']['pool'] = db.pool_stats()
+    results['meta']['writer'] = db.writer_stats()
+    results['meta']['cache'] = get_cache().stats()
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"wrote {args.out}")
+    for section in ('micro', 'pages', 'startup'):
+        for name, stats in results.get(section, {}).items():
+            print(f"  {section + ':' + name:<52}{stats['median_ms']:>10.2f} ms")
+
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Cold-start time to first paint of the login page.
+
+Usage: python benchmarks/startup.py [--runs 5]
+
+Each run is a fresh Python process in an empty directory, so module imports,
+pool setup and schema migrations are all paid the way a new container pays
+them. The child renders the login view once through AppTest and reports its
+timings along with any heavy modules the login path pulled in.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The login page should render without any of these loaded (numpy isn't
+# listed: Streamlit's own set_page_config imports it)
+HEAVY_MODULES = ('pandas', 'plotly.express', 'pyarrow')
+
+
+def _child():
+    t0 = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    t_import = time.perf_counter()
+    at = AppTest.from_file(os.path.join(ROOT, 'streamlit_app.py'), default_timeout=60)
+    at.run()
+    t_paint = time.perf_counter()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    print(json.dumps({
+        'import_ms': (t_import - t0) * 1000,
+        'first_run_ms': (t_paint - t_import) * 1000,
+        'heavy_modules': [m for m in HEAVY_MODULES if m in sys.modules],
+    }))
+
+
+def cold_start():
+    """One login render in a new interpreter; returns its timings in ms.
+
+    ``wall_ms`` spans process launch to the end of the first run, i.e.
+    interpreter start, Streamlit import and the script's own first paint.
+    """
+    workdir = tempfile.mkdtemp()
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        cwd=workdir, capture_output=True, text=True, check=True,
+    )
+    wall = (time.perf_counter() - t0) * 1000
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['wall_ms'] = wall
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child()
+        sys.exit(0)
+
+    runs = [cold_start() for _ in range(args.runs)]
+    for key in ('wall_ms', 'import_ms', 'first_run_ms'):
+        samples = [r[key] for r in runs]
+        print(f"{key:<14}median {statistics.median(samples):>8.1f}  min {min(samples):>8.1f}")
+    heavy = sorted({m for r in runs for m in r['heavy_modules']})
+    print("heavy modules on the login path:", ', '.join(heavy) if heavy else "none")
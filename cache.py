@@ -0,0 +1,110 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 512
+TTL_SECONDS = 300.0
+
+
+class ResultCache:
+    """Bounded LRU/TTL cache for per-user query results.
+
+    Entries are keyed by (user_id, query, params, data_version). Writes bump the
+    user's data version instead of deleting entries, so stale results simply
+    stop being reachable and age out through LRU eviction or the TTL. The TTL
+    also bounds staleness when another process writes to the same database.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        """Invalidates every cached result for ``user_id``."""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return value
+                del self._entries[key]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ResultCache()
+
+
+def get_cache():
+    return _cache
+
+
+def cached(scope=None):
+    """Memoizes a ``fn(user_id, *args)`` reader in the shared result cache.
+
+    ``scope`` is called at lookup time and its value joins the key (e.g. the
+    database path), so the same user id in two databases never collides.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(user_id, *args, **kwargs):
+            key = (
+                scope() if scope else None,
+                user_id,
+                fn.__name__,
+                args,
+                tuple(sorted(kwargs.items())),
+                _cache.version(user_id),
+            )
+            return _cache.get_or_compute(key, lambda: fn(user_id, *args, **kwargs))
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+def invalidate(user_id):
+    _cache.bump(user_id)
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from db import db_paths, get_pool, user_pool
+
+# SQLite stays the source of truth. Live rows are mirrored into Parquet files
+# partitioned by user and year, <MIRROR_DIR>/<db>/user_id=<u>/year=<y>/part.parquet,
+# for the 'parquet' and 'duckdb' engines (db.ANALYTICS_ENGINE).
+MIRROR_DIR = os.environ.get('FINSIGHT_MIRROR_DIR', 'analytics_mirror')
+ROLLUP_COLUMNS = ['day', 'type', 'category', 'total', 'count']
+
+_sync_lock = threading.Lock()
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("The columnar mirror requires pyarrow (pip install pyarrow)") from e
+    return pa, pq
+
+
+def _user_dir(user_id, root=None):
+    # One mirror per database, so two databases in a process never share files
+    scope = os.path.splitext(os.path.basename(get_pool().path))[0]
+    return os.path.join(root or MIRROR_DIR, scope, f"user_id={int(user_id)}")
+
+
+def _read_manifest(user_dir):
+    try:
+        with open(os.path.join(user_dir, '_versions.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(user_dir, versions):
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(versions, f)
+    _write_atomic(os.path.join(user_dir, '_versions.json'), write)
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _write_partition(conn, user_id, year, path):
+    pa, pq = _arrow()
+    rows = conn.execute(
+        "SELECT id, substr(date, 1, 10), COALESCE(type, ''), COALESCE(category, ''), amount FROM transactions "
+        "WHERE user_id = ? AND deleted_batch IS NULL AND date >= ? AND date < ? ORDER BY date, id",
+        # every date string starting with ``year`` sorts inside [year, year + U+FFFF)
+        (user_id, year, year + '\uffff'),
+    ).fetchall()
+    if not rows:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    ids, dates, types, categories, amounts = zip(*rows)
+    table = pa.table({
+        'id': pa.array(ids, pa.int64()),
+        'date': pa.array(dates, pa.string()),
+        'type': pa.array(types, pa.string()).dictionary_encode(),
+        'category': pa.array(categories, pa.string()).dictionary_encode(),
+        'amount': pa.array(amounts, pa.float64()),
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, lambda tmp: pq.write_table(table, tmp, compression='zstd'))
+    return len(rows)
+
+
+def sync_user(user_id, root=None):
+    """Rewrites the user's stale year partitions; returns {year: rows written}.
+
+    Versions are read before the rows, so a write racing the copy leaves the
+    partition marked stale and it is simply redone on the next sync.
+    """
+    user_dir = _user_dir(user_id, root)
+    with _sync_lock:
+        mirrored = _read_manifest(user_dir)
+        with user_pool(user_id).connection() as conn:
+            current = dict(conn.execute(
+                "SELECT year, version FROM partition_versions WHERE user_id = ?", (user_id,)
+            ).fetchall())
+            stale = sorted(y for y, v in current.items() if mirrored.get(y) != v)
+            written = {}
+            for year in stale:
+                path = os.path.join(user_dir, f"year={year}", 'part.parquet')
+                written[year] = _write_partition(conn, user_id, year, path)
+        if stale:
+            os.makedirs(user_dir, exist_ok=True)
+            _write_manifest(user_dir, {**mirrored, **{y: current[y] for y in stale}})
+    return written
+
+
+def sync_all(root=None):
+    """Brings every user's mirror up to date; returns the partitions rewritten."""
+    users = []
+    for path in db_paths(get_pool().path):
+        with get_pool(path).connection() as conn:
+            users += [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM partition_versions")]
+    return sum(len(sync_user(uid, root)) for uid in users)
+
+
+def _partition_files(user_id, start=None, end=None, root=None):
+    user_dir = _user_dir(user_id, root)
+    first = str(start)[:4] if start is not None else None
+    last = str(end)[:4] if end is not None else None
+    files = []
+    for year in sorted(_read_manifest(user_dir)):
+        if (first and year < first) or (last and year > last):
+            continue
+        path = os.path.join(user_dir, f"year={year}", 'part.parquet')
+        if os.path.exists(path):
+            files.append(path)
+    return files
+
+
+def _rollup_pyarrow(files, start, end):
+    import pyarrow.compute as pc
+    pa, pq = _arrow()
+    tables = [pq.read_table(f, columns=['date', 'type', 'category', 'amount']) for f in files]
+    table = pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
+    mask = None
+    if start is not None:
+        mask = pc.greater_equal(table['date'], str(start))
+    if end is not None:
+        upper = pc.less_equal(table['date'], str(end))
+        mask = upper if mask is None else pc.and_(mask, upper)
+    if mask is not None:
+        table = table.filter(mask)
+    out = table.group_by(['date', 'type', 'category']).aggregate([('amount', 'sum'), ('amount', 'count')])
+    return out.to_pandas().rename(columns={'date': 'day', 'amount_sum': 'total', 'amount_count': 'count'})
+
+
+def _rollup_duckdb(files, start, end):
+    try:
+        import duckdb
+    except ImportError as e:
+        raise RuntimeError("FINSIGHT_ANALYTICS_ENGINE=duckdb requires duckdb (pip install duckdb)") from e
+    sql = (
+        "SELECT date AS day, type, category, SUM(amount) AS total, COUNT(*) AS count "
+        "FROM read_parquet(?) WHERE 1 = 1"
+    )
+    params = [files]
+    if start is not None:
+        sql += " AND date >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND date <= ?"
+        params.append(str(end))
+    sql += " GROUP BY ALL"
+    with duckdb.connect() as con:
+        return con.execute(sql, params).df()
+
+
+ENGINES = {
+    'parquet': _rollup_pyarrow,
+    'duckdb': _rollup_duckdb,
+}
+
+
+def mirror_rollup(user_id, start=None, end=None, engine='parquet', root=None):
+    """get_rollup() computed from the columnar mirror, syncing stale partitions first.
+
+    Same frame as the SQLite path: day (datetime), type, category, total, count.
+    """
+    import pandas as pd
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown analytics engine {engine!r}; expected sqlite, {', '.join(ENGINES)}")
+    sync_user(user_id, root)
+    files = _partition_files(user_id, start, end, root)
+    if not files:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    df = ENGINES[engine](files, start, end)[ROLLUP_COLUMNS]
+    for col in ('type', 'category'):
+        df[col] = df[col].astype(object)
+    df['day'] = pd.to_datetime(df['day'], format='%Y-%m-%d', errors='coerce')
+    return df.dropna(subset=['day']).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    import db
+
+    parser = argparse.ArgumentParser(description="Bring the columnar analytics mirror up to date.")
+    parser.add_argument('--db', default=db.DB_FILE)
+    parser.add_argument('--user', type=int, help="only this user (default: everyone)")
+    parser.add_argument('--dir', default=MIRROR_DIR)
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    db.init_db()
+    t0 = time.perf_counter()
+    if args.user is not None:
+        written = sync_user(args.user, args.dir)
+        print(f"user {args.user}: rewrote {len(written)} partitions ({sum(written.values()):,} rows)")
+    else:
+        print(f"rewrote {sync_all(args.dir)} partitions")
+    print(f"in {time.perf_counter() - t0:.2f}s -> {args.dir}")
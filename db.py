@@ -0,0 +1,1251 @@
+import sqlite3
+import hashlib
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from cache import cached, invalidate
+from instrument import traced
+from writer import GroupCommitWriter
+
+# pandas (and analytics, which needs it) are imported inside the functions that
+# build frames, so auth and writes don't pull them in for the login page
+
+DB_FILE = 'budget_v3.db'
+
+# Where get_rollup() aggregates: 'sqlite' (the trigger-maintained daily_rollup),
+# or 'parquet' / 'duckdb' over the columnar mirror in columnar.py
+ANALYTICS_ENGINE = os.environ.get('FINSIGHT_ANALYTICS_ENGINE', 'sqlite')
+# Shorter windows stay on daily_rollup, which wins when there is little to scan
+MIRROR_MIN_DAYS = 90
+
+# FINSIGHT_SHARDS=K spreads users' data over K files next to DB_FILE, which
+# then holds only the users catalog (see sharding.py); 0 keeps it all in DB_FILE
+SHARDS = int(os.environ.get('FINSIGHT_SHARDS', '0'))
+
+# Single-row inserts go through a background writer per database file that
+# commits them in groups (writer.py); FINSIGHT_WRITE_BEHIND=0 commits inline
+WRITE_BEHIND = os.environ.get('FINSIGHT_WRITE_BEHIND', '1') != '0'
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+# Deleted rows stay restorable this long before compaction may purge them
+UNDO_WINDOW_S = 600.0
+# ...plus this, so an undo that starts just inside the window can finish
+PURGE_GRACE_S = 60.0
+# Rows per short write transaction when tombstoning, restoring and purging
+DELETE_BATCH = 500
+PURGE_BATCH = 2000
+MAINTENANCE_INTERVAL_S = 120.0
+# Free pages handed back per incremental_vacuum step
+VACUUM_PAGES = 2000
+
+
+
+class ConnectionPool:
+    """Per-process pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size`` and handed out one caller at a
+    time, so they survive Streamlit reruns instead of being reopened on every
+    data call. Each connection runs in autocommit mode; writes go through
+    ``transaction()`` which takes the write lock up front with BEGIN IMMEDIATE.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, busy_timeout_ms=BUSY_TIMEOUT_MS):
+        self.path = path
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._lock_waiters = 0
+        self._stats = {
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_wait_s': 0.0,
+            'checkout_wait_max_s': 0.0,
+            'transactions': 0,
+            'rollbacks': 0,
+            'lock_waits': 0,
+            'lock_wait_s': 0.0,
+            'lock_wait_max_s': 0.0,
+            'busy_errors': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        # Only takes effect on a new file, and setting it waits for the write lock, so
+        # existing files skip it (they switch via compact(full=True))
+        if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+
+    def _checkout(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                t0 = time.perf_counter()
+                conn = self._idle.get()
+                waited = time.perf_counter() - t0
+                with self._lock:
+                    self._stats['checkout_waits'] += 1
+                    self._stats['checkout_wait_s'] += waited
+                    self._stats['checkout_wait_max_s'] = max(self._stats['checkout_wait_max_s'], waited)
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return conn
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection for reads (or for callers managing their own transaction)."""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Borrows a connection inside a write transaction, committing on success."""
+        with self.connection() as conn:
+            t0 = time.perf_counter()
+            with self._lock:
+                self._lock_waiters += 1
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError:
+                with self._lock:
+                    self._stats['busy_errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._lock_waiters -= 1
+            waited = time.perf_counter() - t0
+            with self._lock:
+                self._stats['transactions'] += 1
+                self._stats['lock_wait_s'] += waited
+                self._stats['lock_wait_max_s'] = max(self._stats['lock_wait_max_s'], waited)
+                if waited > 0.001:
+                    self._stats['lock_waits'] += 1
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                with self._lock:
+                    self._stats['rollbacks'] += 1
+                raise
+            else:
+                conn.commit()
+
+    def yield_writes(self, limit=1.0):
+        """Waits, up to ``limit`` seconds, while other threads here are queued for the write lock.
+
+        SQLite's busy handler sleeps between retries, so a bulk writer that
+        begins its next transaction straight after a commit can keep the
+        lock away from them until they time out; calling this in between
+        lets them in first.
+        """
+        deadline = time.perf_counter() + limit
+        while self._lock_waiters and time.perf_counter() < deadline:
+            time.sleep(0.001)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None):
+    """Returns the process-wide pool for ``path`` (defaults to DB_FILE)."""
+    path = path or DB_FILE
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def _db_path():
+    return get_pool().path
+
+
+def shard_paths(path=None, shards=None):
+    """The shard files belonging to catalog ``path`` (empty when unsharded)."""
+    stem, ext = os.path.splitext(path or DB_FILE)
+    return [f"{stem}.shard{i}{ext}" for i in range(SHARDS if shards is None else shards)]
+
+
+def shard_path(user_id, path=None, shards=None):
+    """The file holding ``user_id``'s transactions, goals and derived tables."""
+    shards = SHARDS if shards is None else shards
+    if not shards:
+        return path or DB_FILE
+    stem, ext = os.path.splitext(path or DB_FILE)
+    return f"{stem}.shard{int(user_id) % shards}{ext}"
+
+
+def db_paths(path=None):
+    """The catalog followed by its shards: every file that needs migrating or maintenance."""
+    path = path or DB_FILE
+    return [path, *shard_paths(path)]
+
+
+def user_pool(user_id):
+    """The pool for the file holding ``user_id``'s data."""
+    return get_pool(shard_path(user_id))
+
+
+_writers = {}
+
+
+def get_writer(path=None):
+    """The group-commit writer for ``path`` (defaults to DB_FILE), started on first use.
+
+    One queue and thread per file: a shard busy with a long import stalls
+    only the users on that shard.
+    """
+    path = path or DB_FILE
+    with _pools_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = GroupCommitWriter(path, get_pool)
+        return writer
+
+
+def writer_stats():
+    """Queue depth, batch sizes and commit/ack latency of the background writers (per file when sharded)."""
+    path = get_pool().path
+    if not SHARDS:
+        return _writers[path].stats() if path in _writers else {}
+    return {os.path.basename(p): _writers[p].stats() for p in shard_paths(path) if p in _writers}
+
+
+def _write(user_id, sql, params):
+    # One statement against the user's file: (lastrowid, rowcount) once committed
+    if WRITE_BEHIND:
+        return get_writer(shard_path(user_id)).submit(sql, params)
+    with user_pool(user_id).transaction() as conn:
+        cur = conn.execute(sql, params)
+        return (cur.lastrowid if cur.rowcount > 0 else None), cur.rowcount
+
+
+def pool_stats():
+    """Pool and lock-wait statistics for the active database (per file when sharded)."""
+    if not SHARDS:
+        return get_pool().stats()
+    return {os.path.basename(p): get_pool(p).stats() for p in db_paths(get_pool().path)}
+
+
+def _create_base_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, type TEXT, category TEXT, amount REAL, date TEXT, description TEXT, FOREIGN KEY(user_id) REFERENCES users(id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS goals (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category TEXT, amount REAL, period TEXT DEFAULT 'Monthly', FOREIGN KEY(user_id) REFERENCES users(id))''')
+
+def _add_goal_period(conn):
+    # Databases created before goal periods existed lack the column
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(goals)")]
+    if 'period' not in cols:
+        conn.execute("ALTER TABLE goals ADD COLUMN period TEXT DEFAULT 'Monthly'")
+
+def _add_core_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_category ON transactions (user_id, category)")
+    # set_goal used to race into duplicate rows; keep the newest before enforcing uniqueness
+    conn.execute("DELETE FROM goals WHERE id NOT IN (SELECT MAX(id) FROM goals GROUP BY user_id, category)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_goals_user_category ON goals (user_id, category)")
+    conn.execute("ANALYZE")
+
+# Baked into the ledger triggers when migration 4 ran; a change to
+# analytics.OUTFLOW_TYPES needs a new migration, not an edit here
+LEDGER_OUTFLOW_TYPES = ('Expense', 'Bill', 'Debt', 'Withdrawal')
+
+def _outflow_sql(col):
+    types = ', '.join(f"'{t}'" for t in LEDGER_OUTFLOW_TYPES)
+    return f"CASE WHEN {col}.type IN ({types}) THEN COALESCE({col}.amount, 0) ELSE 0 END"
+
+def _balances_sql():
+    """(add NEW, remove OLD) trigger statements for the balances ledger."""
+    add_new = f"""INSERT INTO balances (user_id, income, outflow, savings, tx_count) VALUES (
+            NEW.user_id,
+            CASE WHEN NEW.type = 'Income' THEN COALESCE(NEW.amount, 0) ELSE 0 END,
+            {_outflow_sql('NEW')},
+            CASE WHEN NEW.type = 'Savings' THEN COALESCE(NEW.amount, 0) ELSE 0 END,
+            1)
+        ON CONFLICT(user_id) DO UPDATE SET
+            income = income + excluded.income,
+            outflow = outflow + excluded.outflow,
+            savings = savings + excluded.savings,
+            tx_count = tx_count + 1;"""
+    remove_old = f"""UPDATE balances SET
+            income = income - CASE WHEN OLD.type = 'Income' THEN COALESCE(OLD.amount, 0) ELSE 0 END,
+            outflow = outflow - {_outflow_sql('OLD')},
+            savings = savings - CASE WHEN OLD.type = 'Savings' THEN COALESCE(OLD.amount, 0) ELSE 0 END,
+            tx_count = tx_count - 1
+        WHERE user_id = OLD.user_id;"""
+    return add_new, remove_old
+
+def _add_balances(conn):
+    # One row per user, kept in step with transactions by triggers so balance
+    # checks are a primary-key read and move atomically with every write.
+    conn.execute("""CREATE TABLE IF NOT EXISTS balances (
+        user_id INTEGER PRIMARY KEY,
+        income REAL NOT NULL DEFAULT 0,
+        outflow REAL NOT NULL DEFAULT 0,
+        savings REAL NOT NULL DEFAULT 0,
+        tx_count INTEGER NOT NULL DEFAULT 0)""")
+    conn.execute("DELETE FROM balances")
+    conn.execute(f"""INSERT INTO balances (user_id, income, outflow, savings, tx_count)
+        SELECT t.user_id,
+               TOTAL(CASE WHEN t.type = 'Income' THEN t.amount ELSE 0 END),
+               TOTAL({_outflow_sql('t')}),
+               TOTAL(CASE WHEN t.type = 'Savings' THEN t.amount ELSE 0 END),
+               COUNT(*)
+        FROM transactions t GROUP BY t.user_id""")
+    add_new, remove_old = _balances_sql()
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_balances_insert AFTER INSERT ON transactions BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_balances_delete AFTER DELETE ON transactions BEGIN {remove_old} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_balances_update AFTER UPDATE OF user_id, type, amount ON transactions BEGIN {remove_old} {add_new} END")
+
+def _rollup_sql():
+    """(add NEW, remove OLD) trigger statements for daily_rollup."""
+    # Rows without a date have no day and are left out (see DERIVED_TRIGGERS); a missing amount counts as 0
+    add_new = """INSERT INTO daily_rollup (user_id, day, type, category, total, count)
+        VALUES (NEW.user_id, substr(NEW.date, 1, 10), COALESCE(NEW.type, ''), COALESCE(NEW.category, ''), COALESCE(NEW.amount, 0), 1)
+        ON CONFLICT(user_id, day, type, category) DO UPDATE SET total = total + excluded.total, count = count + 1;"""
+    remove_old = """UPDATE daily_rollup SET total = total - COALESCE(OLD.amount, 0), count = count - 1
+        WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND type = COALESCE(OLD.type, '') AND category = COALESCE(OLD.category, '');
+        DELETE FROM daily_rollup
+        WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND type = COALESCE(OLD.type, '') AND category = COALESCE(OLD.category, '') AND count <= 0;"""
+    return add_new, remove_old
+
+def _add_daily_rollup(conn):
+    # Per user/day/type/category sums, maintained by triggers so charts scale
+    # with the days shown rather than the transactions in them.
+    conn.execute("""CREATE TABLE IF NOT EXISTS daily_rollup (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, type, category)) WITHOUT ROWID""")
+    conn.execute("DELETE FROM daily_rollup")
+    conn.execute("""INSERT INTO daily_rollup (user_id, day, type, category, total, count)
+        SELECT user_id, substr(date, 1, 10), COALESCE(type, ''), COALESCE(category, ''), TOTAL(amount), COUNT(*)
+        FROM transactions WHERE date IS NOT NULL GROUP BY 1, 2, 3, 4""")
+    add_new, remove_old = _rollup_sql()
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON transactions BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON transactions BEGIN {remove_old} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_rollup_update AFTER UPDATE OF user_id, type, category, amount, date ON transactions BEGIN {remove_old} {add_new} END")
+
+def _search_sql():
+    """(add NEW, remove OLD) trigger statements for transactions_fts."""
+    # Contentless rows are removed by replaying their original values
+    add_new = """INSERT INTO transactions_fts (rowid, owner, description, category)
+        VALUES (NEW.id, 'u' || NEW.user_id, COALESCE(NEW.description, ''), COALESCE(NEW.category, ''));"""
+    remove_old = """INSERT INTO transactions_fts (transactions_fts, rowid, owner, description, category)
+        VALUES ('delete', OLD.id, 'u' || OLD.user_id, COALESCE(OLD.description, ''), COALESCE(OLD.category, ''));"""
+    return add_new, remove_old
+
+def _add_search_index(conn):
+    # Contentless FTS5 index over description/category. Each row also carries
+    # an owner token (u<user_id>) so a user's search intersects posting lists
+    # inside the index instead of filtering every user's matches afterwards.
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+        owner, description, category,
+        content='', prefix='2 3', tokenize='porter unicode61 remove_diacritics 2')""")
+    conn.execute("DELETE FROM transactions_fts")
+    conn.execute("""INSERT INTO transactions_fts (rowid, owner, description, category)
+        SELECT id, 'u' || user_id, COALESCE(description, ''), COALESCE(category, '') FROM transactions""")
+    add_new, remove_old = _search_sql()
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON transactions BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON transactions BEGIN {remove_old} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF user_id, description, category ON transactions BEGIN {remove_old} {add_new} END")
+
+# Tables derived from transactions by triggers: (trigger statements, columns
+# whose update they follow, extra condition a {row} must meet to be counted)
+DERIVED_TRIGGERS = {
+    'balances': (_balances_sql, 'user_id, type, amount', None),
+    'rollup': (_rollup_sql, 'user_id, type, category, amount, date', "{row}.date IS NOT NULL"),
+    'fts': (_search_sql, 'user_id, description, category', None),
+}
+
+def _add_tombstones(conn):
+    # Deletes now set deleted_batch (the deletions row they belong to) and
+    # the rows are purged later in small batches. Derived tables only count
+    # live rows, so their triggers follow rows into and out of the tombstone.
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(transactions)")]
+    if 'deleted_batch' not in cols:
+        conn.execute("ALTER TABLE transactions ADD COLUMN deleted_batch INTEGER")
+    conn.execute("""CREATE TABLE IF NOT EXISTS deletions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        label TEXT,
+        rows INTEGER NOT NULL DEFAULT 0,
+        deleted_at REAL NOT NULL)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deletions_user ON deletions (user_id, deleted_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_tombstones ON transactions (deleted_batch) WHERE deleted_batch IS NOT NULL")
+    # Live rows only, so category pickers stay a covering index scan
+    conn.execute("DROP INDEX IF EXISTS idx_transactions_user_category")
+    conn.execute("CREATE INDEX idx_transactions_user_category ON transactions (user_id, category) WHERE deleted_batch IS NULL")
+    for name, (statements, watched, guard) in DERIVED_TRIGGERS.items():
+        for event in ('insert', 'delete', 'update'):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{name}_{event}")
+        _create_live_triggers(conn, name, statements(), watched, guard)
+
+# deleted_batch of rows bulk_insert has written but not yet published. The
+# triggers skip them, and also skip their release, because bulk_insert
+# brings the derived tables up to date for the whole slice at once.
+LOADING_BATCH = -1
+
+def _create_live_triggers(conn, name, statements, watched, guard=None):
+    # Keeps a derived table in step with live (non-tombstoned) transactions
+    # that also meet ``guard``
+    add_new, remove_old = statements
+    when = "{row}.deleted_batch IS NULL" + (f" AND {guard}" if guard else "")
+    new, old = when.format(row='NEW'), when.format(row='OLD')
+    conn.execute(f"CREATE TRIGGER trg_{name}_insert AFTER INSERT ON transactions WHEN {new} BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER trg_{name}_delete AFTER DELETE ON transactions WHEN {old} BEGIN {remove_old} END")
+    # Most recently created fires first, so the old row leaves before the new one arrives
+    released = f"{new} AND OLD.deleted_batch IS NOT {LOADING_BATCH}"
+    conn.execute(f"CREATE TRIGGER trg_{name}_update_new AFTER UPDATE OF {watched}, deleted_batch ON transactions WHEN {released} BEGIN {add_new} END")
+    conn.execute(f"CREATE TRIGGER trg_{name}_update_old AFTER UPDATE OF {watched}, deleted_batch ON transactions WHEN {old} BEGIN {remove_old} END")
+
+def _replace_live_triggers(conn, name, statements, watched, guard=None):
+    # Triggers can't be altered: drop all four and create them again
+    for event in ('insert', 'delete', 'update_new', 'update_old'):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{name}_{event}")
+    _create_live_triggers(conn, name, statements, watched, guard)
+
+def _add_partition_versions(conn):
+    # A change counter per user and year, bumped by every write that touches
+    # that year, so the columnar mirror rewrites only the partitions that moved.
+    conn.execute("""CREATE TABLE IF NOT EXISTS partition_versions (
+        user_id INTEGER NOT NULL,
+        year TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, year)) WITHOUT ROWID""")
+    conn.execute("""INSERT OR IGNORE INTO partition_versions (user_id, year, version)
+        SELECT user_id, substr(date, 1, 4), 1 FROM transactions WHERE deleted_batch IS NULL AND date IS NOT NULL GROUP BY 1, 2""")
+    _create_live_triggers(conn, 'partitions', _partitions_sql(), *PARTITION_TRIGGERS)
+
+def _partitions_sql():
+    """(bump NEW's year, bump OLD's year) trigger statements for partition_versions."""
+    bump = """INSERT INTO partition_versions (user_id, year, version) VALUES ({row}.user_id, substr({row}.date, 1, 4), 1)
+        ON CONFLICT(user_id, year) DO UPDATE SET version = version + 1;"""
+    return bump.format(row='NEW'), bump.format(row='OLD')
+
+# Watched columns and guard: a row without a date has no year, and the
+# mirror (which reads daily_rollup) has nothing to rewrite for it
+PARTITION_TRIGGERS = ('user_id, type, category, amount, date', "{row}.date IS NOT NULL")
+
+def _add_settings(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+def _categories_sql():
+    """(add NEW, remove OLD) trigger statements for the categories table."""
+    add_new = """INSERT INTO categories (user_id, name, type, usage_count, last_used)
+        VALUES (NEW.user_id, COALESCE(NEW.category, ''), COALESCE(NEW.type, ''), 1, COALESCE(substr(NEW.date, 1, 10), ''))
+        ON CONFLICT(user_id, type, name) DO UPDATE SET usage_count = usage_count + 1, last_used = MAX(last_used, excluded.last_used);"""
+    # Rows left at zero are kept, so a custom category stays known under its type
+    remove_old = """UPDATE categories SET usage_count = usage_count - 1
+        WHERE user_id = OLD.user_id AND type = COALESCE(OLD.type, '') AND name = COALESCE(OLD.category, '');"""
+    return add_new, remove_old
+
+def _add_categories(conn):
+    # Per user, type and category name: how often it's used and when last, so
+    # pickers read a handful of rows instead of DISTINCT over every transaction.
+    conn.execute("""CREATE TABLE IF NOT EXISTS categories (
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        usage_count INTEGER NOT NULL DEFAULT 0,
+        last_used TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (user_id, type, name)) WITHOUT ROWID""")
+    conn.execute("DELETE FROM categories")
+    conn.execute("""INSERT INTO categories (user_id, name, type, usage_count, last_used)
+        SELECT user_id, COALESCE(category, ''), COALESCE(type, ''), COUNT(*), COALESCE(MAX(substr(date, 1, 10)), '')
+        FROM transactions WHERE deleted_batch IS NULL GROUP BY 1, 2, 3""")
+    _create_live_triggers(conn, 'categories', _categories_sql(), 'user_id, type, category, date')
+
+def _null_safe_rollup(conn):
+    # Rows without a date used to abort their insert, tombstone or undo in
+    # the rollup triggers; files already past migration 7 get the guarded ones
+    statements, watched, guard = DERIVED_TRIGGERS['rollup']
+    _replace_live_triggers(conn, 'rollup', statements(), watched, guard)
+
+def _null_safe_balances(conn):
+    # A row without an amount turned the ledger's sums NULL and failed its NOT NULL columns
+    statements, watched, guard = DERIVED_TRIGGERS['balances']
+    _replace_live_triggers(conn, 'balances', statements(), watched, guard)
+
+def _null_safe_partitions(conn):
+    # Same gap as the rollup: substr(NULL, 1, 4) is no year
+    _replace_live_triggers(conn, 'partitions', _partitions_sql(), *PARTITION_TRIGGERS)
+
+def _bulk_load_triggers(conn):
+    # Rows released from LOADING_BATCH were already counted by bulk_insert
+    for name, (statements, watched, guard) in DERIVED_TRIGGERS.items():
+        _replace_live_triggers(conn, name, statements(), watched, guard)
+    _replace_live_triggers(conn, 'categories', _categories_sql(), 'user_id, type, category, date')
+    _replace_live_triggers(conn, 'partitions', _partitions_sql(), *PARTITION_TRIGGERS)
+
+# Ordered, append-only. Never edit a migration once released; add a new one.
+MIGRATIONS = [
+    (1, 'base tables', _create_base_tables),
+    (2, 'goal period column', _add_goal_period),
+    (3, 'core indexes', _add_core_indexes),
+    (4, 'balances ledger', _add_balances),
+    (5, 'daily rollup', _add_daily_rollup),
+    (6, 'transaction search index', _add_search_index),
+    (7, 'soft-delete tombstones', _add_tombstones),
+    (8, 'partition versions', _add_partition_versions),
+    (9, 'settings', _add_settings),
+    (10, 'category dimension', _add_categories),
+    (11, 'null-safe daily rollup', _null_safe_rollup),
+    (12, 'null-safe partition versions', _null_safe_partitions),
+    (13, 'null-safe balances ledger', _null_safe_balances),
+    (14, 'bulk-load sentinel', _bulk_load_triggers),
+]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def schema_version(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, name TEXT, applied_at TEXT)")
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(path=None):
+    """Applies pending migrations, each in its own transaction. Returns the versions applied."""
+    pool = get_pool(path)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        with pool.transaction() as conn:
+            # Re-read inside the write lock so concurrent processes don't double-apply
+            if version <= schema_version(conn):
+                continue
+            fn(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, time.strftime('%Y-%m-%d %H:%M:%S')),
+            )
+            applied.append(version)
+    return applied
+
+
+@traced
+def init_db():
+    """Brings the catalog and every shard up to date once per process; later calls are free."""
+    catalog = get_pool().path
+    for path in db_paths(catalog):
+        if path in _migrated:
+            continue
+        with _migrate_lock:
+            if path not in _migrated:
+                migrate(path)
+                if path == catalog:
+                    _check_shard_count(path)
+                _migrated.add(path)
+
+
+def _check_shard_count(path):
+    # The catalog remembers how it was split; routing with another K would
+    # silently point users at the wrong files. Only sharding.split_database
+    # records a count: one written here for a file that was never split
+    # would route every user to empty shards.
+    with get_pool(path).connection() as conn:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'shards'").fetchone()
+    recorded = int(row[0]) if row else 0
+    if not recorded and SHARDS:
+        raise RuntimeError(f"{path} is not split but FINSIGHT_SHARDS={SHARDS}; split it first with: python sharding.py {path} --shards {SHARDS}")
+    if recorded != SHARDS:
+        raise RuntimeError(f"{path} is split into {recorded} shards but FINSIGHT_SHARDS={SHARDS}")
+
+
+# Hot read/delete paths that must be served from an index, not a table scan.
+HOT_QUERIES = {
+    'get_user_data': ("SELECT * FROM transactions WHERE user_id = ? AND deleted_batch IS NULL ORDER BY date DESC, id DESC", (1,)),
+    'get_transactions': ("SELECT * FROM transactions WHERE user_id = ? AND deleted_batch IS NULL AND date >= ? AND date < ? ORDER BY date DESC, id DESC", (1, '2024-01-01', '2024-02-01')),
+    'get_transactions_page': ("SELECT id, date, description, category, amount, type FROM transactions WHERE user_id = ? AND deleted_batch IS NULL AND date >= ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?", (1, '2024-01-01', '2024-06-01', 500, 51)),
+    'get_rollup': ("SELECT day, type, category, total, count FROM daily_rollup WHERE user_id = ? AND day >= ? AND day <= ?", (1, '2024-01-01', '2024-01-31')),
+    'get_user_categories': ("SELECT name, usage_count, last_used FROM categories WHERE user_id = ? AND usage_count > 0", (1,)),
+    'get_categories': ("SELECT name, usage_count, last_used FROM categories WHERE user_id = ? AND type IN (?, ?)", (1, 'Expense', 'Bill')),
+    'get_goals': ("SELECT category, amount, period FROM goals WHERE user_id = ?", (1,)),
+    'get_recurring': ("SELECT type, category, amount, date FROM transactions WHERE user_id = ? AND type IN (?, ?, ?) AND deleted_batch IS NULL", (1, 'Income', 'Bill', 'Debt')),
+    'delete_transactions_range': ("SELECT id FROM transactions WHERE user_id = ? AND date BETWEEN ? AND ? AND deleted_batch IS NULL", (1, '2024-01-01', '2024-12-31')),
+    'delete_transactions_category': ("SELECT id FROM transactions WHERE user_id = ? AND category = ? AND deleted_batch IS NULL", (1, 'Food')),
+    'purge_deleted': ("DELETE FROM transactions WHERE id IN (SELECT id FROM transactions WHERE deleted_batch = ? LIMIT ?)", (1, 2000)),
+    'recent_deletions': ("SELECT id, label, rows, deleted_at FROM deletions WHERE user_id = ? AND deleted_at >= ? ORDER BY deleted_at DESC", (1, 0.0)),
+}
+
+
+def explain_hot_queries():
+    """Returns {name: [plan detail, ...]} from EXPLAIN QUERY PLAN for each hot query."""
+    init_db()
+    plans = {}
+    with get_pool().connection() as conn:
+        for name, (sql, params) in HOT_QUERIES.items():
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plans[name] = [r[-1] for r in rows]
+    return plans
+
+
+def check_query_plans():
+    """Raises AssertionError if any hot query falls back to a scan or a temp sort."""
+    problems = []
+    for name, details in explain_hot_queries().items():
+        for detail in details:
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            if full_scan or 'TEMP B-TREE' in detail:
+                problems.append(f"{name}: {detail}")
+    if problems:
+        raise AssertionError("Hot queries not using indexes:\n" + "\n".join(problems))
+    return True
+
+def make_hash(password):
+    return hashlib.sha256(str.encode(password)).hexdigest()
+
+@traced
+def register_user(username, password):
+    try:
+        with get_pool().transaction() as conn:
+            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, make_hash(password)))
+            return True
+    except sqlite3.Error:
+        return False
+
+@traced
+def login_user(username, password):
+    with get_pool().connection() as conn:
+        c = conn.execute('SELECT id, username FROM users WHERE username = ? AND password = ?', (username, make_hash(password)))
+        return c.fetchone()
+
+@traced
+def add_transaction(user_id, type_, category, amount, date, description):
+    """Inserts one transaction and returns its id once committed."""
+    date_str = str(date)
+    row_id, _ = _write(user_id, '''INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)''', (user_id, type_, category, amount, date_str, description))
+    invalidate(user_id)
+    return row_id
+
+# What a guarded write is allowed to draw on, as an expression over balances.
+FUNDS = {
+    'balance': "income - outflow - savings",
+    'savings': "savings",
+}
+
+@traced
+def add_transaction_if_funds(user_id, type_, category, amount, date, description, source='balance'):
+    """Inserts only if the user's balance (or savings) covers ``amount``; returns the new id, or None if not written.
+
+    The check and the insert are one statement, so two sessions spending at
+    once cannot both pass the check and overdraw, even inside one group commit.
+    """
+    date_str = str(date)
+    need = abs(amount)
+    row_id, _ = _write(
+        user_id,
+        f"""INSERT INTO transactions (user_id, type, category, amount, date, description)
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE COALESCE((SELECT {FUNDS[source]} FROM balances WHERE user_id = ?), 0) >= ?""",
+        (user_id, type_, category, amount, date_str, description, user_id, need),
+    )
+    if row_id is not None:
+        invalidate(user_id)
+    return row_id
+
+def _bulk_derived_sql():
+    """Statements folding every LOADING_BATCH row into the derived tables at once."""
+    loading = f"FROM transactions t WHERE t.deleted_batch = {LOADING_BATCH}"
+    return [
+        f"""INSERT INTO balances (user_id, income, outflow, savings, tx_count)
+            SELECT t.user_id,
+                   TOTAL(CASE WHEN t.type = 'Income' THEN t.amount ELSE 0 END),
+                   TOTAL({_outflow_sql('t')}),
+                   TOTAL(CASE WHEN t.type = 'Savings' THEN t.amount ELSE 0 END),
+                   COUNT(*)
+            {loading} GROUP BY t.user_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                income = income + excluded.income,
+                outflow = outflow + excluded.outflow,
+                savings = savings + excluded.savings,
+                tx_count = tx_count + excluded.tx_count""",
+        f"""INSERT INTO daily_rollup (user_id, day, type, category, total, count)
+            SELECT t.user_id, substr(t.date, 1, 10), COALESCE(t.type, ''), COALESCE(t.category, ''), TOTAL(t.amount), COUNT(*)
+            {loading} AND t.date IS NOT NULL GROUP BY 1, 2, 3, 4
+            ON CONFLICT(user_id, day, type, category) DO UPDATE SET total = total + excluded.total, count = count + excluded.count""",
+        f"""INSERT INTO transactions_fts (rowid, owner, description, category)
+            SELECT t.id, 'u' || t.user_id, COALESCE(t.description, ''), COALESCE(t.category, '') {loading}""",
+        f"""INSERT INTO categories (user_id, name, type, usage_count, last_used)
+            SELECT t.user_id, COALESCE(t.category, ''), COALESCE(t.type, ''), COUNT(*), COALESCE(MAX(substr(t.date, 1, 10)), '')
+            {loading} GROUP BY 1, 2, 3
+            ON CONFLICT(user_id, type, name) DO UPDATE SET
+                usage_count = usage_count + excluded.usage_count, last_used = MAX(last_used, excluded.last_used)""",
+        # One bump per year the slice touched is enough for the mirror to notice
+        f"""INSERT INTO partition_versions (user_id, year, version)
+            SELECT t.user_id, substr(t.date, 1, 4), 1 {loading} AND t.date IS NOT NULL GROUP BY 1, 2
+            ON CONFLICT(user_id, year) DO UPDATE SET version = version + 1""",
+    ]
+
+def bulk_insert(conn, rows):
+    """Inserts (user_id, type, category, amount, date, description) rows inside the caller's transaction.
+
+    Per-row triggers cost several times the insert itself, so the rows go in
+    under LOADING_BATCH, where the triggers skip them; each derived table is
+    then updated by one grouped statement and the rows are released. Callers
+    own the transaction, so a failure leaves no loading rows behind.
+    Returns how many rows were inserted.
+    """
+    count = conn.executemany(
+        f"INSERT INTO transactions (user_id, type, category, amount, date, description, deleted_batch) VALUES (?, ?, ?, ?, ?, ?, {LOADING_BATCH})",
+        rows,
+    ).rowcount
+    for sql in _bulk_derived_sql():
+        conn.execute(sql)
+    conn.execute(f"UPDATE transactions SET deleted_batch = NULL WHERE deleted_batch = {LOADING_BATCH}")
+    return count
+
+def _tombstone(user_id, label, ids):
+    """Marks ``ids`` deleted under one new deletions row; returns how many were marked.
+
+    Each DELETE_BATCH rows is its own short transaction, and the lock is
+    left free for as long as it was held so other sessions' writes interleave
+    instead of waiting behind one long statement.
+    """
+    if not ids:
+        return 0
+    pool = user_pool(user_id)
+    with pool.transaction() as conn:
+        batch = conn.execute(
+            "INSERT INTO deletions (user_id, label, rows, deleted_at) VALUES (?, ?, 0, ?)",
+            (user_id, label, time.time()),
+        ).lastrowid
+    count = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        if i:
+            time.sleep(held)
+        t0 = time.perf_counter()
+        with pool.transaction() as conn:
+            count += conn.executemany(
+                "UPDATE transactions SET deleted_batch = ? WHERE id = ? AND deleted_batch IS NULL",
+                zip(itertools.repeat(batch), ids[i:i + DELETE_BATCH]),
+            ).rowcount
+            conn.execute("UPDATE deletions SET rows = ? WHERE id = ?", (count, batch))
+        held = time.perf_counter() - t0
+    invalidate(user_id)
+    return count
+
+@traced
+def delete_transaction(tx_id, user_id=None):
+    """Soft-deletes one transaction; with ``user_id`` only if it is theirs (required when sharded)."""
+    if user_id is None:
+        if SHARDS:
+            raise ValueError("delete_transaction needs a user_id when the database is sharded")
+        with get_pool().connection() as conn:
+            row = conn.execute("SELECT user_id FROM transactions WHERE id = ? AND deleted_batch IS NULL", (tx_id,)).fetchone()
+    else:
+        with user_pool(user_id).connection() as conn:
+            row = conn.execute(
+                "SELECT user_id FROM transactions WHERE id = ? AND user_id = ? AND deleted_batch IS NULL", (tx_id, user_id)
+            ).fetchone()
+    if row:
+        _tombstone(row[0], f"ID {tx_id}", [tx_id])
+
+@traced
+def delete_transactions_range(user_id, start_date, end_date):
+    s_str = str(start_date)
+    e_str = str(end_date)
+    with user_pool(user_id).connection() as conn:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM transactions WHERE user_id = ? AND date BETWEEN ? AND ? AND deleted_batch IS NULL",
+            (user_id, s_str, e_str),
+        )]
+    return _tombstone(user_id, f"{s_str} to {e_str}", ids)
+
+@traced
+def delete_transactions_category(user_id, category):
+    with user_pool(user_id).connection() as conn:
+        ids = [r[0] for r in conn.execute(
+            "SELECT id FROM transactions WHERE user_id = ? AND category = ? AND deleted_batch IS NULL",
+            (user_id, category),
+        )]
+    return _tombstone(user_id, f"Category {category}", ids)
+
+@traced
+def recent_deletions(user_id):
+    """The user's deletions still inside the undo window, newest first."""
+    with user_pool(user_id).connection() as conn:
+        rows = conn.execute(
+            "SELECT id, label, rows, deleted_at FROM deletions WHERE user_id = ? AND deleted_at >= ? ORDER BY deleted_at DESC",
+            (user_id, time.time() - UNDO_WINDOW_S),
+        ).fetchall()
+    return [{'id': r[0], 'label': r[1], 'rows': r[2], 'deleted_at': r[3]} for r in rows]
+
+@traced
+def undo_deletion(user_id, batch_id):
+    """Restores a deletion made within the undo window; returns how many rows came back (0 if too late)."""
+    pool = user_pool(user_id)
+    with pool.connection() as conn:
+        live = conn.execute(
+            "SELECT 1 FROM deletions WHERE id = ? AND user_id = ? AND deleted_at >= ?",
+            (batch_id, user_id, time.time() - UNDO_WINDOW_S),
+        ).fetchone()
+        ids = [r[0] for r in conn.execute("SELECT id FROM transactions WHERE deleted_batch = ?", (batch_id,))] if live else []
+    if not live:
+        return 0
+    count = 0
+    for i in range(0, len(ids), DELETE_BATCH):
+        with pool.transaction() as conn:
+            count += conn.executemany(
+                "UPDATE transactions SET deleted_batch = NULL WHERE id = ? AND deleted_batch = ?",
+                zip(ids[i:i + DELETE_BATCH], itertools.repeat(batch_id)),
+            ).rowcount
+    with pool.transaction() as conn:
+        conn.execute("DELETE FROM deletions WHERE id = ?", (batch_id,))
+    invalidate(user_id)
+    return count
+
+def purge_deleted(older_than=UNDO_WINDOW_S + PURGE_GRACE_S, batch_size=PURGE_BATCH, path=None):
+    """Physically removes tombstoned rows whose undo window has passed; returns the row count.
+
+    Purged rows are already invisible, so the delete triggers skip them and
+    each PURGE_BATCH is a cheap, short transaction. Tombstones whose
+    deletions row is gone (an interrupted purge) are cleared too.
+    """
+    pool = get_pool(path)
+    with pool.connection() as conn:
+        batches = [r[0] for r in conn.execute(
+            "SELECT DISTINCT t.deleted_batch FROM transactions t LEFT JOIN deletions d ON d.id = t.deleted_batch "
+            "WHERE t.deleted_batch IS NOT NULL AND (d.id IS NULL OR d.deleted_at < ?)",
+            (time.time() - older_than,),
+        )]
+    removed = 0
+    for batch in batches:
+        with pool.transaction() as conn:
+            conn.execute("DELETE FROM deletions WHERE id = ?", (batch,))
+        while True:
+            with pool.transaction() as conn:
+                n = conn.execute(
+                    "DELETE FROM transactions WHERE id IN (SELECT id FROM transactions WHERE deleted_batch = ? LIMIT ?)",
+                    (batch, batch_size),
+                ).rowcount
+            removed += n
+            if n < batch_size:
+                break
+    return removed
+
+def compact(path=None, full=False):
+    """Purges expired tombstones, returns free pages to the filesystem and refreshes planner stats.
+
+    Free pages go back VACUUM_PAGES at a time via incremental_vacuum, so a
+    pass never holds the write lock for long. ``full=True`` runs a one-off
+    VACUUM instead, which also converts a database created before
+    incremental auto-vacuum was enabled. Returns a dict of what was done.
+    """
+    removed = purge_deleted(path=path)
+    pool = get_pool(path)
+    with pool.connection() as conn:
+        if full:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if free and incremental:
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(VACUUM_PAGES)});")
+        # ANALYZEs only the tables whose stats have drifted
+        conn.execute("PRAGMA optimize")
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {'purged': removed, 'free_pages_before': free, 'free_pages_after': left, 'incremental': incremental}
+
+_maintenance = {}
+
+def _maintenance_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        for target in db_paths(path):
+            try:
+                compact(target)
+            except sqlite3.Error:
+                pass  # busy or locked; the next round retries
+
+def start_maintenance(interval=MAINTENANCE_INTERVAL_S, path=None):
+    """Runs compact() every ``interval`` seconds on a daemon thread, once per process and database."""
+    path = path or DB_FILE
+    with _pools_lock:
+        thread = _maintenance.get(path)
+        if thread is None:
+            thread = _maintenance[path] = threading.Thread(
+                target=_maintenance_loop, args=(path, interval), name='db-maintenance', daemon=True)
+            thread.start()
+    return thread
+
+FRAME_COLUMNS = ('id', 'user_id', 'type', 'category', 'amount', 'date', 'description')
+
+def typed_frame(df):
+    """Converts a raw transactions frame to compact dtypes in place and returns it.
+
+    type/category become categoricals, ids are downcast, dates are parsed on
+    the ISO fast path (unparseable rows dropped), and the income/outflow/
+    savings masks are computed once so callers don't re-compare strings.
+    """
+    import pandas as pd
+    from analytics import OUTFLOW_TYPES, TRANSACTION_TYPES, parse_dates
+
+    for col in ('id', 'user_id'):
+        if col in df:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    if 'type' in df:
+        df['type'] = pd.Categorical(df['type'], categories=TRANSACTION_TYPES)
+        df['is_income'] = (df['type'] == 'Income').to_numpy()
+        df['is_outflow'] = df['type'].isin(OUTFLOW_TYPES).to_numpy()
+        df['is_savings'] = (df['type'] == 'Savings').to_numpy()
+    if 'category' in df:
+        df['category'] = df['category'].astype('category')
+    if 'amount' in df:
+        df['amount'] = df['amount'].astype('float64')
+    if 'date' in df:
+        df['date'] = parse_dates(df['date'])
+        df = df.dropna(subset=['date'])
+    return df
+
+@traced
+@cached(scope=_db_path)
+def get_transactions(user_id, start=None, end=None, columns=FRAME_COLUMNS):
+    """Transactions with start <= date <= end (inclusive dates; None leaves that side open).
+
+    Selects only ``columns`` and returns them as a typed_frame().
+    """
+    sql = f"SELECT {', '.join(columns)} FROM transactions WHERE user_id = ? AND deleted_batch IS NULL"
+    params = [user_id]
+    if start is not None:
+        sql += " AND date >= ?"
+        params.append(str(start))
+    if end is not None:
+        # Half-open upper bound so stored values with a time component still match
+        sql += " AND date < ?"
+        params.append(str(end + timedelta(days=1)))
+    sql += " ORDER BY date DESC, id DESC"
+    import pandas as pd
+    with user_pool(user_id).connection() as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    return typed_frame(df)
+
+@traced
+def get_user_data(user_id):
+    return get_transactions(user_id)
+
+@traced
+@cached(scope=_db_path)
+def get_rollup(user_id, start=None, end=None):
+    """Daily per type/category totals for the window (inclusive dates; None = open)."""
+    if ANALYTICS_ENGINE != 'sqlite' and (start is None or ((end or date.today()) - start).days >= MIRROR_MIN_DAYS):
+        from columnar import mirror_rollup
+        return mirror_rollup(user_id, start, end, engine=ANALYTICS_ENGINE)
+    sql = "SELECT day, type, category, total, count FROM daily_rollup WHERE user_id = ?"
+    params = [user_id]
+    if start is not None:
+        sql += " AND day >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND day <= ?"
+        params.append(str(end))
+    import pandas as pd
+    with user_pool(user_id).connection() as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    df['day'] = pd.to_datetime(df['day'], format='%Y-%m-%d', errors='coerce')
+    return df.dropna(subset=['day'])
+
+@traced
+@cached(scope=_db_path)
+def get_totals(user_id):
+    """Lifetime income/outflow/savings and the resulting balance, read from the balances ledger."""
+    with user_pool(user_id).connection() as conn:
+        row = conn.execute(
+            "SELECT tx_count, income, outflow, savings FROM balances WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    count, income, outflow, savings = row or (0, 0.0, 0.0, 0.0)
+    return {
+        'count': count,
+        'income': income,
+        'outflow': outflow,
+        'savings': savings,
+        'balance': income - (outflow + savings),
+    }
+
+GRID_COLUMNS = ('id', 'date', 'description', 'category', 'amount', 'type')
+
+def _grid_filters(user_id, start=None, end=None, type_=None, category=None):
+    where = ["user_id = ?", "deleted_batch IS NULL"]
+    params = [user_id]
+    if start is not None:
+        where.append("date >= ?")
+        params.append(str(start))
+    if end is not None:
+        where.append("date < ?")
+        params.append(str(end + timedelta(days=1)))
+    if type_ is not None:
+        where.append("type = ?")
+        params.append(type_)
+    if category is not None:
+        where.append("category = ?")
+        params.append(category)
+    return where, params
+
+@traced
+@cached(scope=_db_path)
+def get_transactions_page(user_id, start=None, end=None, type_=None, category=None, after=None, page_size=50, newest_first=True):
+    """One page of the transaction grid, keyset-paginated on (date, id).
+
+    ``after`` is the (date, id) cursor of the last row of the previous page;
+    seeking past it costs the same on page 1 and page 1000. Returns
+    (rows, next_cursor) where next_cursor is None on the last page.
+    """
+    where, params = _grid_filters(user_id, start, end, type_, category)
+    op, direction = ('<', 'DESC') if newest_first else ('>', 'ASC')
+    if after is not None:
+        where.append(f"(date, id) {op} (?, ?)")
+        params.extend(after)
+    sql = (
+        f"SELECT {', '.join(GRID_COLUMNS)} FROM transactions WHERE {' AND '.join(where)} "
+        f"ORDER BY date {direction}, id {direction} LIMIT ?"
+    )
+    params.append(page_size + 1)
+    with user_pool(user_id).connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = (rows[-1][1], rows[-1][0]) if has_more else None
+    import pandas as pd
+    from analytics import parse_dates
+
+    df = pd.DataFrame.from_records(rows, columns=GRID_COLUMNS)
+    df['date'] = parse_dates(df['date'])
+    return df, next_cursor
+
+@traced
+@cached(scope=_db_path)
+def count_transactions(user_id, start=None, end=None, type_=None, category=None):
+    """Row count for the grid filters, read from the ledger or daily rollup rather than counting rows."""
+    if start is None and end is None and type_ is None and category is None:
+        return get_totals(user_id)['count']
+    sql = "SELECT COALESCE(SUM(count), 0) FROM daily_rollup WHERE user_id = ?"
+    params = [user_id]
+    if start is not None:
+        sql += " AND day >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND day <= ?"
+        params.append(str(end))
+    if type_ is not None:
+        sql += " AND type = ?"
+        params.append(type_)
+    if category is not None:
+        sql += " AND category = ?"
+        params.append(category)
+    with user_pool(user_id).connection() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+_SEARCH_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+
+def search_query(text):
+    """Turns search box text into an FTS5 MATCH expression, or None if there's nothing to match.
+
+    "quoted words" match as a phrase, a trailing * makes a prefix match
+    (star* finds Starbucks) and every other word must appear. Terms are
+    always quoted, so FTS5 operators and punctuation in user text are literal.
+    """
+    parts = []
+    for phrase, word in _SEARCH_TERM.findall(text or ''):
+        term = phrase if phrase else word
+        prefix = not phrase and term.endswith('*')
+        term = term.rstrip('*').replace('"', '""').strip()
+        if term:
+            parts.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(parts) or None
+
+SEARCH_WEIGHTS = (0.0, 10.0, 4.0)  # bm25 weights for owner, description, category
+
+@traced
+@cached(scope=_db_path)
+def search_transactions(user_id, text, start=None, end=None, type_=None, category=None, limit=50):
+    """Best full-text matches for ``text`` in description/category, combinable with the grid filters.
+
+    Returns GRID_COLUMNS plus ``rank`` (bm25, lower is better), best match
+    first and newest first among equals.
+    """
+    import pandas as pd
+    from analytics import parse_dates
+
+    match = search_query(text)
+    if match is None:
+        return pd.DataFrame(columns=[*GRID_COLUMNS, 'rank'])
+    where, params = _grid_filters(user_id, start, end, type_, category)
+    sql = (
+        f"SELECT {', '.join(GRID_COLUMNS)}, m.rank FROM ("
+        f"SELECT rowid, bm25(transactions_fts, {', '.join(map(str, SEARCH_WEIGHTS))}) AS rank "
+        f"FROM transactions_fts WHERE transactions_fts MATCH ?) m "
+        f"JOIN transactions t ON t.id = m.rowid WHERE {' AND '.join(where)} "
+        f"ORDER BY m.rank, date DESC, id DESC LIMIT ?"
+    )
+    params = [f"owner : u{int(user_id)} AND {{description category}} : ({match})", *params, limit]
+    with user_pool(user_id).connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    df = pd.DataFrame.from_records(rows, columns=[*GRID_COLUMNS, 'rank'])
+    df['date'] = parse_dates(df['date'])
+    return df
+
+# Offered in the pickers for each type until the user has their own
+DEFAULT_CATEGORIES = {
+    'Income': ("Salary", "Freelance", "Business", "Investment", "Gift", "Other"),
+    'Expense': ("Food", "Shopping", "Transport", "Entertainment", "Health", "Education", "Travel", "Personal", "Other"),
+    'Bill': ("Rent", "Utilities", "Internet", "Phone", "Insurance", "Subscription", "Gym", "Other"),
+    'Debt': ("Credit Card", "Loan", "Mortgage", "Other"),
+    'Savings': ("Emergency Fund", "Retirement", "Vacation", "Home", "Car", "General"),
+}
+
+def _ranked_categories(user_id, types=None, used_only=False):
+    # Names across the requested types, most used first, then most recently used
+    sql = "SELECT name, usage_count, last_used FROM categories WHERE user_id = ?"
+    params = [user_id]
+    if types is not None:
+        sql += f" AND type IN ({', '.join('?' * len(types))})"
+        params.extend(types)
+    if used_only:
+        sql += " AND usage_count > 0"
+    with user_pool(user_id).connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    usage = {}
+    for name, count, last_used in rows:
+        if name:
+            total, latest = usage.get(name, (0, ''))
+            usage[name] = (total + count, max(latest, last_used))
+    return sorted(sorted(usage), key=usage.get, reverse=True)
+
+@traced
+@cached(scope=_db_path)
+def get_user_categories(user_id):
+    """Categories of the user's live transactions, most used first."""
+    return _ranked_categories(user_id, used_only=True)
+
+@traced
+@cached(scope=_db_path)
+def get_categories(user_id, types=None):
+    """Picker choices for ``types`` (a tuple; None = all): the user's own categories, most used first, then unused defaults."""
+    names = _ranked_categories(user_id, types)
+    seen = set(names)
+    for type_ in (DEFAULT_CATEGORIES if types is None else types):
+        for name in DEFAULT_CATEGORIES.get(type_, ()):
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return names
+
+@traced
+def set_goal(user_id, category, amount, period):
+    with user_pool(user_id).transaction() as conn:
+        conn.execute(
+            "INSERT INTO goals (user_id, category, amount, period) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id, category) DO UPDATE SET amount = excluded.amount, period = excluded.period",
+            (user_id, category, amount, period),
+        )
+    invalidate(user_id)
+
+@traced
+@cached(scope=_db_path)
+def get_goals(user_id):
+    import pandas as pd
+    with user_pool(user_id).connection() as conn:
+        # Select period as well
+        return pd.read_sql_query("SELECT category, amount, period FROM goals WHERE user_id = ?", conn, params=(user_id,))
+
+@traced
+@cached(scope=_db_path)
+def get_recurring(user_id):
+    """The user's recurring Income/Bill/Debt series, as found by analytics.detect_recurring()."""
+    import pandas as pd
+    from analytics import RECURRING_TYPES, detect_recurring
+    marks = ', '.join('?' * len(RECURRING_TYPES))
+    with user_pool(user_id).connection() as conn:
+        df = pd.read_sql_query(
+            f"SELECT type, category, amount, date FROM transactions WHERE user_id = ? AND type IN ({marks}) AND deleted_batch IS NULL",
+            conn, params=(user_id, *RECURRING_TYPES),
+        )
+    return detect_recurring(typed_frame(df))
+
+@traced
+@cached(scope=_db_path)
+def get_forecast(user_id, months=6):
+    """Month-by-month balance projection from recurring series and goals (analytics.project_cash_flow()).
+
+    Rows already entered for dates after today are scheduled into their own
+    months and taken back out of the lifetime balance the projection starts from.
+    """
+    from analytics import project_cash_flow
+    scheduled = get_transactions(user_id, start=date.today() + timedelta(days=1), columns=('type', 'category', 'amount', 'date'))
+    ahead = scheduled['amount'].where(scheduled['is_income'], -scheduled['amount']).sum()
+    balance = get_totals(user_id)['balance'] - ahead
+    return project_cash_flow(get_recurring(user_id), get_goals(user_id), balance, months, scheduled=scheduled)
+
+
+if __name__ == '__main__':
+    for name, details in explain_hot_queries().items():
+        print(name)
+        for detail in details:
+            print('   ', detail)
+    check_query_plans()
+    print('All hot queries use indexes.')
@@ -0,0 +1,108 @@
+import csv
+import io
+import tempfile
+from datetime import timedelta
+
+from db import user_pool
+
+EXPORT_COLUMNS = ('id', 'user_id', 'type', 'category', 'amount', 'date', 'description')
+CHUNK_SIZE = 5000
+# Exports larger than this spill from memory to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _export_query(user_id, start=None, end=None, category=None):
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM transactions WHERE user_id = ? AND deleted_batch IS NULL"
+    params = [user_id]
+    if start is not None:
+        sql += " AND date >= ?"
+        params.append(str(start))
+    if end is not None:
+        sql += " AND date < ?"
+        params.append(str(end + timedelta(days=1)))
+    if category is not None:
+        sql += " AND category = ?"
+        params.append(category)
+    sql += " ORDER BY date DESC, id DESC"
+    return sql, params
+
+
+def iter_export_chunks(user_id, start=None, end=None, category=None, chunk_size=CHUNK_SIZE):
+    """Yields lists of up to ``chunk_size`` row tuples straight from a cursor."""
+    sql, params = _export_query(user_id, start, end, category)
+    with user_pool(user_id).connection() as conn:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def write_csv(out, user_id, start=None, end=None, category=None, chunk_size=CHUNK_SIZE):
+    """Streams the export as UTF-8 CSV into the binary file ``out``. Returns the row count."""
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for rows in iter_export_chunks(user_id, start, end, category, chunk_size):
+        writer.writerows(rows)
+        count += len(rows)
+    text.flush()
+    text.detach()
+    return count
+
+
+def write_parquet(out, user_id, start=None, end=None, category=None, chunk_size=CHUNK_SIZE):
+    """Streams the export into ``out`` as Parquet, one row group per chunk. Returns the row count.
+
+    Needs pyarrow (installed alongside Streamlit).
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('type', pa.string()),
+        ('category', pa.string()),
+        ('amount', pa.float64()),
+        ('date', pa.string()),
+        ('description', pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(out, schema, compression='snappy') as writer:
+        for rows in iter_export_chunks(user_id, start, end, category, chunk_size):
+            columns = list(zip(*rows))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            count += len(rows)
+        if count == 0:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+WRITERS = {
+    'csv': write_csv,
+    'parquet': write_parquet,
+}
+
+
+def export_file(fmt, user_id, start=None, end=None, category=None):
+    """Builds the export in a spooled temp file and returns it rewound for reading."""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    WRITERS[fmt](out, user_id, start, end, category)
+    out.seek(0)
+    return out
+
+
+def export_bytes(fmt, user_id, start=None, end=None, category=None):
+    """The export as bytes, for st.download_button (which needs the whole payload)."""
+    with export_file(fmt, user_id, start, end, category) as f:
+        return f.read()
@@ -0,0 +1,264 @@
+import argparse
+import io
+import itertools
+import re
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from analytics import TRANSACTION_TYPES, parse_dates
+from cache import invalidate
+from db import bulk_insert, user_pool
+
+CHUNK_SIZE = 50000
+# Rows per write transaction: each commit releases the file's write lock, so
+# other sessions' single-row writes wait for one slice, not the whole file
+COMMIT_ROWS = 1000
+DEFAULT_CATEGORY = 'Other'
+# How many rejected rows to keep in the report for display
+REJECT_SAMPLE = 20
+
+# Bank exports name the same columns many ways; matched case-insensitively
+COLUMN_ALIASES = {
+    'date': ['date', 'transaction date', 'posting date', 'posted date', 'booking date', 'value date'],
+    'amount': ['amount', 'transaction amount', 'value'],
+    'debit': ['debit', 'withdrawal', 'money out', 'paid out'],
+    'credit': ['credit', 'deposit', 'money in', 'paid in'],
+    'description': ['description', 'memo', 'payee', 'name', 'details', 'narrative'],
+    'category': ['category'],
+    'type': ['type'],
+}
+
+
+def _map_columns(columns):
+    lowered = {c.strip().lower(): c for c in columns}
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                mapping[lowered[alias]] = field
+                break
+    return mapping
+
+
+def _parse_amount(col):
+    # "$1,234.50" -> 1234.50 and accounting-style "(12.00)" -> -12.00
+    s = col.astype('string').str.strip()
+    s = s.str.replace(r'^\((.*)\)$', r'-\1', regex=True)
+    s = s.str.replace(r'[,$£€\s]', '', regex=True)
+    return pd.to_numeric(s, errors='coerce').astype('float64')
+
+
+def normalize_chunk(raw, date_format=None):
+    """Turns one raw chunk into (rows, rejected) with columns date/type/category/amount/description.
+
+    Everything is column-wise: amounts lose currency symbols and separators,
+    dates go to ISO strings, and a missing or unknown type falls back to the
+    amount's sign (negative = Expense, positive = Income).
+    """
+    df = raw.rename(columns=_map_columns(raw.columns))
+
+    if 'amount' in df:
+        amount = _parse_amount(df['amount'])
+    elif 'debit' in df or 'credit' in df:
+        credit = _parse_amount(df['credit']).fillna(0) if 'credit' in df else 0
+        debit = _parse_amount(df['debit']).fillna(0) if 'debit' in df else 0
+        amount = pd.Series(credit - debit, index=df.index)
+        amount[(amount == 0)] = np.nan
+    else:
+        raise ValueError("No amount, debit or credit column found")
+    if 'date' not in df:
+        raise ValueError("No date column found")
+    dates = parse_dates(df['date'], date_format)
+
+    if 'type' in df:
+        given = df['type'].astype('string').str.strip().str.title()
+        type_ = given.where(given.isin(TRANSACTION_TYPES))
+    else:
+        type_ = pd.Series(pd.NA, index=df.index, dtype='string')
+    type_ = type_.fillna(pd.Series(np.where(amount < 0, 'Expense', 'Income'), index=df.index))
+
+    out = pd.DataFrame({
+        'date': dates.dt.strftime('%Y-%m-%d'),
+        'type': type_.astype(object),
+        'category': df['category'].astype('string').str.strip().fillna(DEFAULT_CATEGORY).astype(object) if 'category' in df else DEFAULT_CATEGORY,
+        'amount': amount.abs().round(2),
+        'description': df['description'].astype('string').str.strip().fillna('').astype(object) if 'description' in df else '',
+    }, index=df.index)
+
+    reason = pd.Series(pd.NA, index=df.index, dtype='string')
+    reason[amount.isna()] = 'bad amount'
+    reason[dates.isna()] = 'bad date'
+    bad = reason.notna()
+    rejected = raw[bad].assign(reason=reason[bad])
+    return out[~bad], rejected
+
+
+def read_csv_chunks(source, chunk_size=CHUNK_SIZE):
+    return pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[''])
+
+
+_OFX_TAG = re.compile(r'<(/?\w+)>([^<\r\n]*)')
+
+
+def read_ofx_chunks(source, chunk_size=CHUNK_SIZE):
+    """Streams <STMTTRN> records from an OFX/QFX statement (SGML or XML flavour)."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if hasattr(source, 'read'):
+        lines = io.TextIOWrapper(source, encoding='utf-8', errors='replace') if not isinstance(source, io.TextIOBase) else source
+        close = False
+    else:
+        lines = open(source, encoding='utf-8', errors='replace')
+        close = True
+    try:
+        batch, current = [], None
+        for line in lines:
+            # Tags in order, so compact XML with several records per line splits correctly
+            for tag, value in _OFX_TAG.findall(line):
+                tag = tag.upper()
+                if tag == 'STMTTRN':
+                    current = {}
+                elif tag == '/STMTTRN':
+                    if current is not None:
+                        batch.append(current)
+                        current = None
+                    if len(batch) >= chunk_size:
+                        yield _ofx_frame(batch)
+                        batch = []
+                elif current is not None and value and not tag.startswith('/'):
+                    current[tag] = value.strip()
+        if current:
+            batch.append(current)
+        if batch:
+            yield _ofx_frame(batch)
+    finally:
+        if close:
+            lines.close()
+        elif isinstance(lines, io.TextIOWrapper) and lines is not source:
+            lines.detach()
+
+
+def _ofx_frame(records):
+    df = pd.DataFrame.from_records(records)
+    desc = df.get('NAME', pd.Series('', index=df.index)).fillna('')
+    if 'MEMO' in df:
+        desc = desc.where(desc != '', df['MEMO'].fillna(''))
+    return pd.DataFrame({
+        # DTPOSTED looks like 20240131120000[-5:EST]; the day is all we keep
+        'date': df.get('DTPOSTED', pd.Series(pd.NA, index=df.index)).str[:8],
+        'amount': df.get('TRNAMT', pd.Series(pd.NA, index=df.index)),
+        'description': desc,
+    })
+
+
+KEY_COLUMNS = ['date', 'amount', 'description']
+
+
+def _row_keys(rows):
+    # 64-bit hash of (date, amount, description); collisions are negligible at statement sizes
+    return pd.util.hash_pandas_object(rows[KEY_COLUMNS], index=False).to_numpy()
+
+
+def _existing_keys(conn, user_id, chunk_size=CHUNK_SIZE):
+    chunks = pd.read_sql_query(
+        "SELECT date, ROUND(amount, 2) AS amount, COALESCE(description, '') AS description "
+        "FROM transactions WHERE user_id = ? AND deleted_batch IS NULL",
+        conn,
+        params=(user_id,),
+        chunksize=chunk_size,
+    )
+    keys = Counter()
+    for chunk in chunks:
+        keys.update(_row_keys(chunk).tolist())
+    return keys
+
+
+def import_transactions(user_id, chunks, date_format=None):
+    """Loads parsed chunks for ``user_id``, committing every COMMIT_ROWS rows.
+
+    A row is a duplicate while the user already has as many rows with its
+    (date, amount, description) as the file has had so far: importing a
+    statement twice adds nothing, but two identical same-day charges in it
+    both land. Keys are hashed and counted, so the check is a dict probe
+    rather than a query per chunk. The
+    existing keys are read before any write lock is taken. If the import
+    stops part way, the slices already committed stay, and importing the
+    same file again skips them as duplicates.
+    Returns a report dict: rows read/inserted, duplicates skipped, rejected
+    rows (count plus a small sample with reasons), elapsed seconds and rows/s.
+    """
+    t0 = time.perf_counter()
+    report = {'read': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'rejected_sample': []}
+    pool = user_pool(user_id)
+    with pool.connection() as conn:
+        existing = _existing_keys(conn, user_id)
+    try:
+        for raw in chunks:
+            report['read'] += len(raw)
+            rows, rejected = normalize_chunk(raw, date_format)
+            report['rejected'] += len(rejected)
+            room = REJECT_SAMPLE - len(report['rejected_sample'])
+            if room > 0 and not rejected.empty:
+                report['rejected_sample'].extend(rejected.head(room).to_dict('records'))
+
+            fresh_mask = np.zeros(len(rows), dtype=bool)
+            for i, key in enumerate(_row_keys(rows).tolist()):
+                if existing[key]:
+                    existing[key] -= 1
+                else:
+                    fresh_mask[i] = True
+            # date order keeps index inserts local and ids chronological
+            fresh = rows[fresh_mask].sort_values('date', kind='stable')
+            report['duplicates'] += len(rows) - len(fresh)
+            for start in range(0, len(fresh), COMMIT_ROWS):
+                part = fresh.iloc[start:start + COMMIT_ROWS]
+                pool.yield_writes()
+                with pool.transaction() as conn:
+                    bulk_insert(conn, zip(
+                        itertools.repeat(user_id),
+                        part['type'].tolist(),
+                        part['category'].tolist(),
+                        part['amount'].tolist(),
+                        part['date'].tolist(),
+                        part['description'].tolist(),
+                    ))
+                report['inserted'] += len(part)
+    finally:
+        invalidate(user_id)
+    elapsed = time.perf_counter() - t0
+    report['seconds'] = elapsed
+    report['rows_per_sec'] = report['read'] / elapsed if elapsed > 0 else 0.0
+    return report
+
+
+def import_file(user_id, source, fmt=None, chunk_size=CHUNK_SIZE, date_format=None):
+    """Imports a CSV or OFX/QFX statement from a path or file object."""
+    if fmt is None:
+        name = source if isinstance(source, str) else getattr(source, 'name', '')
+        fmt = 'ofx' if str(name).lower().endswith(('.ofx', '.qfx')) else 'csv'
+    reader = read_ofx_chunks if fmt == 'ofx' else read_csv_chunks
+    return import_transactions(user_id, reader(source, chunk_size), date_format)
+
+
+if __name__ == '__main__':
+    import db
+
+    parser = argparse.ArgumentParser(description="Bulk import a bank statement (CSV or OFX) for one user.")
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('path')
+    parser.add_argument('--db', default=db.DB_FILE)
+    parser.add_argument('--format', choices=['csv', 'ofx'])
+    parser.add_argument('--date-format', help="strftime format when dates aren't ISO, e.g. %%d/%%m/%%Y")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    db.init_db()
+    report = import_file(args.user_id, args.path, args.format, args.chunk_size, args.date_format)
+    print(f"read {report['read']:,}  inserted {report['inserted']:,}  duplicates {report['duplicates']:,}  "
+          f"rejected {report['rejected']:,}  in {report['seconds']:.2f}s ({report['rows_per_sec']:,.0f} rows/s)")
+    for row in report['rejected_sample']:
+        print('  rejected:', row)
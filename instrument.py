@@ -0,0 +1,165 @@
+import contextvars
+import functools
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# JSON-lines timing log, one line per rerun; unset disables logging
+TIMING_LOG = os.environ.get('FINSIGHT_TIMING_LOG')
+
+_trace = contextvars.ContextVar('finsight_trace', default=None)
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """Spans collected during one script run."""
+
+    def __init__(self, label, **meta):
+        self.label = label
+        self.meta = meta
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    def total_ms(self):
+        return (time.perf_counter() - self.t0) * 1000
+
+    def records(self):
+        return [
+            {'name': s.name, 'depth': s.depth, 'start_ms': s.start_ms, 'ms': s.ms, 'rows': s.rows, **s.attrs}
+            for s in self.spans
+        ]
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attrs', 'depth', 'start_ms', 'ms', 'rows', '_t0')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.rows = None
+        self.ms = None
+
+    def __enter__(self):
+        trace = self.trace
+        self._t0 = time.perf_counter()
+        self.start_ms = (self._t0 - trace.t0) * 1000
+        self.depth = trace._depth
+        trace._depth += 1
+        trace.spans.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._t0) * 1000
+        self.trace._depth -= 1
+        return False
+
+
+class _NullSpan:
+    """What span() hands out when nothing is tracing: no clock reads, no allocation."""
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **attrs):
+    """Times a block under the current trace; a no-op when tracing is off.
+
+    Set ``.rows`` on the returned span to record how many rows it handled.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, attrs)
+
+
+def _row_count(result):
+    # Frames and lists count rows; (frame, cursor) pages count the frame; scalars/dicts don't
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, (dict, str)):
+        return None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def traced(fn):
+    """Wraps a data function in a span named after it, recording result rows."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        trace = _trace.get()
+        if trace is None:
+            return fn(*args, **kwargs)
+        with _Span(trace, name, {}) as s:
+            result = fn(*args, **kwargs)
+            s.rows = _row_count(result)
+        return result
+    return wrapper
+
+
+def tracing_wanted(panel=False):
+    return panel or bool(TIMING_LOG)
+
+
+def start_trace(label, **meta):
+    trace = Trace(label, **meta)
+    _trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Stops tracing this run and appends it to the timing log if one is configured."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    _trace.set(None)
+    if TIMING_LOG:
+        line = json.dumps({
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'label': trace.label,
+            **trace.meta,
+            'total_ms': round(trace.total_ms(), 3),
+            'spans': [{k: (round(v, 3) if isinstance(v, float) else v) for k, v in r.items()} for r in trace.records()],
+        }, default=str)
+        with _log_lock, open(TIMING_LOG, 'a') as f:
+            f.write(line + '\n')
+    return trace
+
+
+@contextmanager
+def section(name, panel=False, **meta):
+    """A span around a rerunnable page section (a Streamlit fragment).
+
+    During a full rerun it nests under that run's trace. When the fragment
+    reruns on its own there is no trace yet, so it opens one labelled
+    ``fragment:<name>``, closes (and logs) it on exit and yields it;
+    otherwise it yields None.
+    """
+    if _trace.get() is not None or not tracing_wanted(panel):
+        with span(name):
+            yield None
+        return
+    trace = start_trace(f"fragment:{name}", **meta)
+    try:
+        with span(name):
+            yield trace
+    finally:
+        end_trace()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from db import get_pool, migrate, shard_paths
+
+# Splits a single-file database into a users catalog plus K shard files,
+# user_id % K picking the shard (db.shard_path). Run it once, offline, then
+# start the app with FINSIGHT_SHARDS=K. The original file is kept as
+# <stem>.unsplit<ext> so the split can be undone by moving it back.
+
+# Copied verbatim, ids included, so links between them survive the move;
+# balances, daily_rollup, the search index, partition_versions and categories are derived
+# and get rebuilt by the shard's own triggers as the rows land
+USER_TABLES = {
+    'deletions': 'id, user_id, label, rows, deleted_at',
+    'goals': 'id, user_id, category, amount, period',
+    'transactions': 'id, user_id, type, category, amount, date, description, deleted_batch',
+}
+
+
+def _copy(target, source, statements):
+    # ATTACH can't run inside a transaction, so this uses its own connection
+    # rather than a pooled one
+    conn = sqlite3.connect(target, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (source,))
+        conn.execute("BEGIN IMMEDIATE")
+        counts = [conn.execute(sql).rowcount for sql in statements]
+        conn.execute("COMMIT")
+        return counts
+    finally:
+        conn.close()
+
+
+def _release(path):
+    # Back to a rollback journal so the file is whole on disk and renames
+    # safely; this needs the only connection, so it fails while the app has it open
+    get_pool(path).close()
+    conn = sqlite3.connect(path, isolation_level=None, timeout=0)
+    try:
+        mode = conn.execute("PRAGMA journal_mode=DELETE").fetchone()[0]
+    except sqlite3.OperationalError:
+        mode = None
+    finally:
+        conn.close()
+    if mode != 'delete':
+        raise RuntimeError(f"{path} is open elsewhere; stop the app before splitting")
+
+
+def split_database(source, shards):
+    """Moves every user's rows out of ``source`` into ``shards`` shard files.
+
+    ``source`` ends up as the catalog (users and settings only). Returns
+    {shard path: transactions copied}.
+    """
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    stem, ext = os.path.splitext(source)
+    backup, catalog = f"{stem}.unsplit{ext}", f"{stem}.catalog{ext}"
+    targets = shard_paths(source, shards)
+    taken = [p for p in (backup, catalog, *targets) if os.path.exists(p)]
+    if taken:
+        raise RuntimeError(f"Refusing to overwrite {', '.join(taken)}")
+
+    _release(source)
+    migrate(source)
+    with get_pool(source).connection() as conn:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'shards'").fetchone()
+    if row and int(row[0]):
+        raise RuntimeError(f"{source} is already split into {row[0]} shards")
+
+    copied = {}
+    for i, target in enumerate(targets):
+        migrate(target)
+        statements = [
+            f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM src.{table} WHERE user_id % {shards} = {i} ORDER BY id"
+            for table, cols in USER_TABLES.items()
+        ]
+        # Bump past the source's versions so no mirrored partition looks current
+        statements.append(
+            "UPDATE partition_versions SET version = version + COALESCE((SELECT s.version FROM src.partition_versions s "
+            "WHERE s.user_id = partition_versions.user_id AND s.year = partition_versions.year), 0)"
+        )
+        copied[target] = _copy(target, source, statements)[2]
+
+    migrate(catalog)
+    _copy(catalog, source, [
+        "INSERT INTO main.users (id, username, password) SELECT id, username, password FROM src.users ORDER BY id",
+        # New sign-ups must not reuse an id the source ever handed out
+        "UPDATE main.sqlite_sequence SET seq = MAX(seq, (SELECT seq FROM src.sqlite_sequence WHERE name = 'users')) "
+        "WHERE name = 'users'",
+        f"INSERT OR REPLACE INTO main.settings (key, value) VALUES ('shards', '{int(shards)}')",
+    ])
+
+    for path in (source, catalog, *targets):
+        _release(path)
+    os.replace(source, backup)
+    os.replace(catalog, source)
+    return copied
+
+
+if __name__ == '__main__':
+    import db
+
+    parser = argparse.ArgumentParser(description="Split a database into a users catalog and per-user shards.")
+    parser.add_argument('db', nargs='?', default=db.DB_FILE)
+    parser.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    copied = split_database(args.db, args.shards)
+    for path, rows in copied.items():
+        print(f"{path}: {rows:,} transactions")
+    stem, ext = os.path.splitext(args.db)
+    print(f"in {time.perf_counter() - t0:.2f}s; original kept as {stem}.unsplit{ext}")
+    print(f"start the app with FINSIGHT_SHARDS={args.shards}")
@@ -1,15 +1,36 @@
+import os
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import sqlite3
-import hashlib
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from db import (
+    init_db, register_user, login_user, add_transaction, add_transaction_if_funds, delete_transaction,
+    delete_transactions_range, delete_transactions_category,
+    get_user_categories, get_categories, set_goal, get_goals, get_totals, get_rollup,
+    get_transactions_page, count_transactions, search_transactions, get_forecast,
+    recent_deletions, undo_deletion, start_maintenance, pool_stats, writer_stats,
+)
+from export import export_bytes
+from cache import cache_stats
+from instrument import span, section, tracing_wanted, start_trace, end_trace
 
 try:
     st.set_page_config(page_title="FinSight", page_icon="", layout="wide", initial_sidebar_state="expanded")
 except AttributeError:
     pass
 
+# Opt-in timing panel, set by whoever runs the server (FINSIGHT_DEBUG=1): it shows
+# server-wide pool, writer and cache stats, so visitors can't turn it on.
+# Logs go to FINSIGHT_TIMING_LOG when set.
+debug_panel = os.environ.get("FINSIGHT_DEBUG") == "1"
+
+def trace_meta():
+    ctx = get_script_run_ctx()
+    return dict(session=ctx.session_id if ctx else None, user_id=st.session_state.get("user_id"))
+
+if tracing_wanted(debug_panel):
+    start_trace("rerun", **trace_meta())
+
 st.markdown("""
     <style>
         .stApp {
@@ -66,104 +87,9 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-DB_FILE = 'budget_v3.db'
-
-def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, type TEXT, category TEXT, amount REAL, date TEXT, description TEXT, FOREIGN KEY(user_id) REFERENCES users(id))''')
-        c.execute('''CREATE TABLE IF NOT EXISTS goals (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category TEXT, amount REAL, period TEXT DEFAULT 'Monthly', FOREIGN KEY(user_id) REFERENCES users(id))''')
-        
-        # Migration to add period column if it doesn't exist (for existing databases)
-        try:
-            c.execute("ALTER TABLE goals ADD COLUMN period TEXT DEFAULT 'Monthly'")
-        except:
-            pass # Column likely exists
-        conn.commit()
-
-def make_hash(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def register_user(username, password):
-    try:
-        with sqlite3.connect(DB_FILE) as conn:
-            c = conn.cursor()
-            c.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, make_hash(password)))
-            conn.commit()
-            return True
-    except:
-        return False
-
-def login_user(username, password):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute('SELECT id, username FROM users WHERE username = ? AND password = ?', (username, make_hash(password)))
-        return c.fetchone()
-
-def add_transaction(user_id, type_, category, amount, date, description):
-    date_str = str(date)
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute('''INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)''', (user_id, type_, category, amount, date_str, description))
-        conn.commit()
-
-def delete_transaction(tx_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM transactions WHERE id = ?", (tx_id,))
-        conn.commit()
-
-def delete_transactions_range(user_id, start_date, end_date):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        s_str = str(start_date)
-        e_str = str(end_date)
-        c.execute("DELETE FROM transactions WHERE user_id = ? AND date BETWEEN ? AND ?", (user_id, s_str, e_str))
-        count = c.rowcount
-        conn.commit()
-        return count
-
-def delete_transactions_category(user_id, category):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM transactions WHERE user_id = ? AND category = ?", (user_id, category))
-        count = c.rowcount
-        conn.commit()
-        return count
-
-def get_user_data(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT * FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC", conn, params=(user_id,))
-    
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        df = df.dropna(subset=['date']) 
-    return df
-
-def get_user_categories(user_id):
-    """Fetches all unique categories used by the user in transactions."""
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT DISTINCT category FROM transactions WHERE user_id = ?", conn, params=(user_id,))
-    return df['category'].tolist() if not df.empty else []
-
-def set_goal(user_id, category, amount, period):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("SELECT id FROM goals WHERE user_id = ? AND category = ?", (user_id, category))
-        data = c.fetchone()
-        if data:
-            c.execute("UPDATE goals SET amount = ?, period = ? WHERE id = ?", (amount, period, data[0]))
-        else:
-            c.execute("INSERT INTO goals (user_id, category, amount, period) VALUES (?, ?, ?, ?)", (user_id, category, amount, period))
-        conn.commit()
-
-def get_goals(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        # Select period as well
-        return pd.read_sql_query("SELECT category, amount, period FROM goals WHERE user_id = ?", conn, params=(user_id,))
-
 init_db()
+# Purges expired soft-deletes and compacts in the background, once per process
+start_maintenance()
 
 def login_view():
     st.markdown("<br><br>", unsafe_allow_html=True)
@@ -195,27 +121,36 @@ def login_view():
                     else:
                         st.error("Username unavailable.")
 
-if 'user_id' not in st.session_state: st.session_state.user_id = None
-
-if st.session_state.user_id is None:
-    login_view()
-else:
-    df = get_user_data(st.session_state.user_id)
-    goals_df = get_goals(st.session_state.user_id)
-    
-    # Get user's custom categories from DB
-    user_cats = get_user_categories(st.session_state.user_id)
-    
-    if df.empty:
-        total_inc, total_exp, total_sav, current_bal = 0.0, 0.0, 0.0, 0.0
-    else:
-        total_inc = df[df['type'] == 'Income']['amount'].sum()
-        total_outflow_mask = df['type'].isin(['Expense', 'Bill', 'Debt', 'Withdrawal'])
-        total_exp = df[total_outflow_mask]['amount'].sum()
-        total_sav = df[df['type'] == 'Savings']['amount'].sum()
-        current_bal = total_inc - (total_exp + total_sav)
-    
-    with st.sidebar:
+def timing_panel(trace):
+    import pandas as pd
+    import plotly.express as px
+
+    with st.sidebar.expander("⏱️ Rerun Timings", expanded=True):
+        spans = pd.DataFrame(trace.records(), columns=['name', 'depth', 'start_ms', 'ms', 'rows'])
+        st.caption(f"Total {trace.total_ms():,.1f} ms · {len(spans)} spans")
+        if not spans.empty:
+            spans['label'] = [("· " * d) + n for d, n in zip(spans['depth'], spans['name'])]
+            fig = px.bar(spans, x='ms', y='label', base='start_ms', orientation='h', hover_data=['rows'])
+            fig.update_yaxes(autorange="reversed", title="", type='category')
+            fig.update_layout(plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#FAFAFA'), xaxis=dict(title="ms"), margin=dict(t=10, l=0, r=0, b=0), height=max(200, 22 * len(spans)))
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(spans[['label', 'start_ms', 'ms', 'rows']], hide_index=True, use_container_width=True)
+        st.caption("Connection pool")
+        st.json(pool_stats(), expanded=False)
+        st.caption("Write queue")
+        st.json(writer_stats(), expanded=False)
+        st.caption("Result cache")
+        st.json(cache_stats(), expanded=False)
+
+def fragment_timing(trace):
+    # Only a fragment rerunning on its own owns a trace; full reruns go to the sidebar panel
+    if debug_panel and trace is not None:
+        st.caption(f"⏱️ {trace.label} {trace.total_ms():,.1f} ms · {len(trace.spans)} spans")
+
+@st.fragment
+def sidebar_view():
+    # Pickers here rerun only this fragment; a submitted write reruns the app so every view picks it up
+    with section("sidebar", debug_panel, **trace_meta()) as own_trace:
         st.markdown(f"### Hello, {st.session_state.username}")
         if st.button("Sign Out", key="logout"):
             st.session_state.user_id = None
@@ -225,25 +160,11 @@ else:
         with st.expander("➕ New Transaction", expanded=True):
             ft_type = st.selectbox("Type", ["Expense", "Income", "Bill", "Debt", "Savings"])
             
-            if ft_type == "Income":
-                base_cats = ["Salary", "Freelance", "Business", "Investment", "Gift", "Other"]
-            elif ft_type == "Expense":
-                base_cats = ["Food", "Shopping", "Transport", "Entertainment", "Health", "Education", "Travel", "Personal", "Other"]
-            elif ft_type == "Bill":
-                base_cats = ["Rent", "Utilities", "Internet", "Phone", "Insurance", "Subscription", "Gym", "Other"]
-            elif ft_type == "Debt":
-                base_cats = ["Credit Card", "Loan", "Mortgage", "Other"]
-            elif ft_type == "Savings":
-                base_cats = ["Emergency Fund", "Retirement", "Vacation", "Home", "Car", "General"]
-            else:
-                base_cats = ["General"]
-            
-            # Merge base categories with any custom ones the user created previously
-            # We filter user_cats to only include ones that aren't already in base_cats
-            # Note: A real app might store category-to-type mapping, but here we just show all known categories + type defaults
+            # The user's categories for this type (custom ones included), most used first, then the defaults
+            type_cats = get_categories(st.session_state.user_id, (ft_type,))
             
             # Allow Custom
-            sel_cat = st.selectbox("Category", base_cats + ["Custom"])
+            sel_cat = st.selectbox("Category", type_cats + ["Custom"])
             if sel_cat == "Custom":
                 final_cat = st.text_input("Enter Custom Category", placeholder="e.g. Dog Grooming")
                 if not final_cat: final_cat = "Custom"
@@ -257,17 +178,20 @@ else:
                 ft_date = c_date.date_input("Date", datetime.today())
                 
                 if st.form_submit_button("Add Entry", use_container_width=True):
-                    if ft_type in ["Expense", "Bill", "Debt", "Savings"]:
-                        if ft_amt > current_bal:
-                            st.error(f"❌ Insufficient Balance! (${current_bal:,.2f})")
+                    try:
+                        if ft_type in ["Expense", "Bill", "Debt", "Savings"]:
+                            if add_transaction_if_funds(st.session_state.user_id, ft_type, final_cat, ft_amt, ft_date, ft_desc):
+                                st.toast("Entry Added", icon="✅")
+                                st.rerun()
+                            else:
+                                st.error(f"❌ Insufficient Balance! (${get_totals(st.session_state.user_id)['balance']:,.2f})")
                         else:
                             add_transaction(st.session_state.user_id, ft_type, final_cat, ft_amt, ft_date, ft_desc)
-                            st.toast("Entry Added", icon="✅")
+                            st.toast("Income Added", icon="✅")
                             st.rerun()
-                    else:
-                        add_transaction(st.session_state.user_id, ft_type, final_cat, ft_amt, ft_date, ft_desc)
-                        st.toast("Income Added", icon="✅")
-                        st.rerun()
+                    except Exception as e:
+                        # e.g. the database stayed locked past the busy timeout
+                        st.error(f"Entry Failed: {e}")
 
         with st.expander("🔁 Quick Transfer", expanded=False):
             with st.form("quick_transfer", border=False):
@@ -284,37 +208,32 @@ else:
                         dt_str = t_date.strftime("%Y-%m-%d")
                         
                         if t_act == "Save to Pot":
-                            if val > current_bal:
-                                st.error(f"❌ Insufficient Balance! (${current_bal:,.2f})")
-                            else:
-                                add_transaction(st.session_state.user_id, "Savings", "Transfer", val, dt_str, "Manual Save")
+                            if add_transaction_if_funds(st.session_state.user_id, "Savings", "Transfer", val, dt_str, "Manual Save"):
                                 st.toast("Saved to Pot", icon="✅")
                                 st.rerun()
+                            else:
+                                st.error(f"❌ Insufficient Balance! (${get_totals(st.session_state.user_id)['balance']:,.2f})")
                                 
                         elif t_act == "Withdraw from Balance":
-                            if val > current_bal:
-                                st.error(f"❌ Insufficient Balance! (${current_bal:,.2f})")
-                            else:
-                                add_transaction(st.session_state.user_id, "Withdrawal", "Cash", val, dt_str, "Cash Withdrawal")
+                            if add_transaction_if_funds(st.session_state.user_id, "Withdrawal", "Cash", val, dt_str, "Cash Withdrawal"):
                                 st.toast("Withdrawn from Balance", icon="✅")
                                 st.rerun()
+                            else:
+                                st.error(f"❌ Insufficient Balance! (${get_totals(st.session_state.user_id)['balance']:,.2f})")
                                 
                         elif t_act == "Withdraw from Savings":
-                            if val > total_sav:
-                                st.error(f"❌ Insufficient Savings! (${total_sav:,.2f})")
-                            else:
-                                add_transaction(st.session_state.user_id, "Savings", "Transfer", -val, dt_str, "Withdraw from Savings")
+                            if add_transaction_if_funds(st.session_state.user_id, "Savings", "Transfer", -val, dt_str, "Withdraw from Savings", source='savings'):
                                 st.toast("Moved to Balance", icon="✅")
                                 st.rerun()
+                            else:
+                                st.error(f"❌ Insufficient Savings! (${get_totals(st.session_state.user_id)['savings']:,.2f})")
                                 
                     except Exception as e:
                         st.error(f"Transfer Failed: {e}")
         
         with st.expander("🎯 Set Goal", expanded=False):
-            # Combine defaults with actual used categories
-            default_goal_cats = ["Food", "Shopping", "Transport", "Entertainment", "Health", "Education", "Travel", "Personal", "Rent", "Utilities", "Internet", "Phone"]
-            # Merge and de-duplicate
-            all_available_cats = sorted(list(set(default_goal_cats + user_cats)))
+            # Goals track outflow, so only outflow categories are offered
+            all_available_cats = get_categories(st.session_state.user_id, OUTFLOW_TYPES)
             
             sel_g_cat = st.selectbox("Category", all_available_cats + ["Custom"], key="goal_cat_sel")
             
@@ -334,6 +253,22 @@ else:
                     st.toast("Goal Saved", icon="✅")
                     st.rerun()
         
+        with st.expander("📥 Import Statement", expanded=False):
+            up_file = st.file_uploader("Bank export (CSV or OFX)", type=["csv", "ofx", "qfx"], label_visibility="collapsed")
+            up_date_fmt = st.text_input("Date format (optional)", placeholder="e.g. %d/%m/%Y")
+            if st.button("Import", use_container_width=True, disabled=up_file is None):
+                try:
+                    report = import_file(st.session_state.user_id, up_file, date_format=up_date_fmt or None)
+                    st.session_state.import_report = report
+                    st.rerun()
+                except ValueError as e:
+                    st.error(f"Import Failed: {e}")
+            report = st.session_state.get("import_report")
+            if report:
+                st.caption(f"Imported {report['inserted']:,} of {report['read']:,} rows in {report['seconds']:.1f}s · {report['duplicates']:,} duplicates · {report['rejected']:,} rejected")
+                if report['rejected_sample']:
+                    st.dataframe(pd.DataFrame(report['rejected_sample']), hide_index=True)
+
         with st.expander("🗑️ Delete Data", expanded=False):
             del_mode = st.radio("Mode", ["Specific ID", "Date Range", "By Category"], horizontal=True, label_visibility="collapsed")
             
@@ -341,7 +276,7 @@ else:
                 if del_mode == "Specific ID":
                     del_id = st.number_input("ID to Delete", min_value=0, step=1)
                     if st.form_submit_button("Delete ID", use_container_width=True):
-                        delete_transaction(del_id)
+                        delete_transaction(del_id, st.session_state.user_id)
                         st.toast("Deleted ID", icon="🗑️")
                         st.rerun()
                 
@@ -355,13 +290,12 @@ else:
                         st.rerun()
                         
                 elif del_mode == "By Category":
-                    # Use the combined list here too
-                    all_del_cats = sorted(list(set(["All"] + user_cats + default_goal_cats)))
                     # Moving selectbox outside form for custom logic
                     pass
             
             if del_mode == "By Category":
-                all_del_cats = sorted(list(set(user_cats + ["Food", "Rent", "Transport", "Shopping"]))) # Basic fallback
+                # Only categories that still have transactions, most used first
+                all_del_cats = get_user_categories(st.session_state.user_id)
                 sel_del_cat = st.selectbox("Category to Delete", all_del_cats + ["Custom"])
                 if sel_del_cat == "Custom":
                     final_del_cat = st.text_input("Type Category to Delete")
@@ -374,178 +308,272 @@ else:
                         st.toast(f"Deleted {count} records", icon="🗑️")
                         st.rerun()
 
-    c_title, c_filter = st.columns([3, 1])
-    with c_title:
-        st.title("Overview")
-    with c_filter:
-        time_range = st.selectbox("Time Period", ["This Month", "All Time", "Today", "Yesterday", "This Week", "This Year", "Custom Range"], label_visibility="collapsed")
-
-    if not df.empty:
-        today = datetime.today()
-        # View Duration in Days (approx)
-        view_days = 30.0 # Default
+            # Deleted rows are kept for a while before being purged, so recent deletes can be taken back
+            for batch in recent_deletions(st.session_state.user_id)[:3]:
+                c_lbl, c_undo = st.columns([3, 1])
+                c_lbl.caption(f"{batch['label']} · {batch['rows']:,} rows")
+                if c_undo.button("Undo", key=f"undo_{batch['id']}"):
+                    restored = undo_deletion(st.session_state.user_id, batch['id'])
+                    if restored:
+                        st.toast(f"Restored {restored} records", icon="↩️")
+                    else:
+                        st.toast("Too late to undo", icon="⚠️")
+                    st.rerun()
+    fragment_timing(own_trace)
+
+@st.fragment
+def overview_view():
+    # The period filter reruns only this fragment (and the grid nested in it)
+    with section("overview", debug_panel, **trace_meta()) as own_trace:
+        uid = st.session_state.user_id
+        goals_df = get_goals(uid)
+        totals = get_totals(uid)
+        has_data = totals['count'] > 0
+        total_sav, current_bal = totals['savings'], totals['balance']
+
+        c_title, c_filter = st.columns([3, 1])
+        with c_title:
+            st.title("Overview")
+        with c_filter:
+            time_range = st.selectbox("Time Period", ["This Month", "All Time", "Today", "Yesterday", "This Week", "This Year", "Custom Range"], label_visibility="collapsed")
+
+        if has_data:
+            today = datetime.today()
+            # Window bounds are inclusive dates (None = open); view_days is the approx view duration
+            start_day, end_day, view_days = period_window(time_range, today)
         
-        if time_range == "Custom Range":
-            st.markdown("###### Select Range")
-            cr_type = st.selectbox("Type", ["Date Range", "Specific Day", "Specific Month", "Specific Year"], label_visibility="collapsed")
+            if time_range == "Custom Range":
+                st.markdown("###### Select Range")
+                cr_type = st.selectbox("Type", ["Date Range", "Specific Day", "Specific Month", "Specific Year"], label_visibility="collapsed")
             
-            if cr_type == "Date Range":
-                c_d1, c_d2 = st.columns(2)
-                d_start = c_d1.date_input("Start", today - timedelta(days=30))
-                d_end = c_d2.date_input("End", today)
-                if d_start <= d_end:
-                    filtered_df = df[(df['date'].dt.date >= d_start) & (df['date'].dt.date <= d_end)]
-                    view_days = (d_end - d_start).days + 1
-                else:
-                    st.error("Start date must be before end date")
-                    filtered_df = df
+                if cr_type == "Date Range":
+                    c_d1, c_d2 = st.columns(2)
+                    d_start = c_d1.date_input("Start", today - timedelta(days=30))
+                    d_end = c_d2.date_input("End", today)
+                    if d_start <= d_end:
+                        start_day, end_day = d_start, d_end
+                        view_days = (d_end - d_start).days + 1
+                    else:
+                        st.error("Start date must be before end date")
             
-            elif cr_type == "Specific Day":
-                sel_day = st.date_input("Select Day", today)
-                filtered_df = df[df['date'].dt.date == sel_day]
-                view_days = 1.0
+                elif cr_type == "Specific Day":
+                    sel_day = st.date_input("Select Day", today)
+                    start_day, end_day = sel_day, sel_day
+                    view_days = 1.0
                 
-            elif cr_type == "Specific Month":
-                c_m1, c_m2 = st.columns(2)
-                sel_year = c_m1.number_input("Year", 2000, 2100, today.year)
-                months_list = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
-                sel_month_name = c_m2.selectbox("Month", months_list, index=today.month-1)
-                sel_month = months_list.index(sel_month_name) + 1
-                filtered_df = df[(df['date'].dt.year == sel_year) & (df['date'].dt.month == sel_month)]
-                view_days = 30.0
+                elif cr_type == "Specific Month":
+                    c_m1, c_m2 = st.columns(2)
+                    sel_year = c_m1.number_input("Year", 2000, 2100, today.year)
+                    months_list = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+                    sel_month_name = c_m2.selectbox("Month", months_list, index=today.month-1)
+                    sel_month = months_list.index(sel_month_name) + 1
+                    start_day, end_day = month_window(int(sel_year), sel_month)
+                    view_days = 30.0
                 
-            elif cr_type == "Specific Year":
-                sel_year_only = st.number_input("Select Year", 2000, 2100, today.year)
-                filtered_df = df[df['date'].dt.year == sel_year_only]
-                view_days = 365.0
-
-        elif time_range == "Today":
-            filtered_df = df[df['date'].dt.date == today.date()]
-            view_days = 1.0
-        elif time_range == "Yesterday":
-            filtered_df = df[df['date'].dt.date == (today - timedelta(days=1)).date()]
-            view_days = 1.0
-        elif time_range == "This Week":
-            start_week = today - timedelta(days=today.weekday())
-            filtered_df = df[df['date'].dt.date >= start_week.date()]
-            view_days = 7.0
-        elif time_range == "This Month":
-            filtered_df = df[(df['date'].dt.month == today.month) & (df['date'].dt.year == today.year)]
+                elif cr_type == "Specific Year":
+                    sel_year_only = int(st.number_input("Select Year", 2000, 2100, today.year))
+                    start_day, end_day = date(sel_year_only, 1, 1), date(sel_year_only, 12, 31)
+                    view_days = 365.0
+
+            rollup_df = get_rollup(st.session_state.user_id, start_day, end_day)
+        else:
+            rollup_df = pd.DataFrame(columns=['day', 'type', 'category', 'total', 'count'])
+            start_day = end_day = None
             view_days = 30.0
-        elif time_range == "This Year":
-            filtered_df = df[df['date'].dt.year == today.year]
-            view_days = 365.0
-        else: 
-            filtered_df = df
-            view_days = 30.0 # Default for All Time scaling? or just 1.0
-    else:
-        filtered_df = pd.DataFrame()
-        view_days = 30.0
-
-    if df.empty:
-        st.info("No transactions yet. Add one from the sidebar.")
-    else:
-        if not filtered_df.empty:
-            p_inc = filtered_df[filtered_df['type'] == 'Income']['amount'].sum()
-            p_out_mask = filtered_df['type'].isin(['Expense', 'Bill', 'Debt', 'Withdrawal'])
-            p_exp = filtered_df[p_out_mask]['amount'].sum()
+
+        if not has_data:
+            st.info("No transactions yet. Add one from the sidebar.")
         else:
-            p_inc, p_exp = 0.0, 0.0
-
-        k1, k2, k3, k4 = st.columns(4)
-        k1.metric(f"Income ({time_range})", f"${p_inc:,.0f}")
-        k2.metric(f"Expenses ({time_range})", f"${p_exp:,.0f}")
-        k3.metric("Total Savings", f"${total_sav:,.0f}") 
-        k4.metric("Current Balance", f"${current_bal:,.0f}", delta_color="normal")
-        st.markdown("<br>", unsafe_allow_html=True)
-
-        if not filtered_df.empty:
-            c_left, c_right = st.columns([2, 1])
-            with c_left:
-                st.subheader("Activity")
-                chart_df = filtered_df.copy()
-                if time_range in ["Today", "Yesterday", "Specific Day"]:
-                    trend = chart_df.groupby(['type'])['amount'].sum().reset_index()
-                    fig = px.bar(trend, x='type', y='amount', color='type', 
-                                 color_discrete_map={'Income': '#30D158', 'Expense': '#FF453A', 'Withdrawal': '#FF9F0A', 'Savings': '#0A84FF'})
-                else:
-                    chart_df['day'] = chart_df['date'].dt.strftime('%b %d')
-                    trend = chart_df.groupby(['day', 'type'])['amount'].sum().reset_index()
-                    trend = trend[trend['type'].isin(['Income', 'Expense', 'Withdrawal'])]
-                    fig = px.bar(trend, x='day', y='amount', color='type', barmode='group',
-                                 color_discrete_map={'Income': '#30D158', 'Expense': '#FF453A', 'Withdrawal': '#FF9F0A'})
+            with span("kpis"):
+                exp_by_cat = totals_by(rollup_df, 'category', OUTFLOW_TYPES)
+                p_inc = totals_by(rollup_df, 'type').get('Income', 0.0)
+                p_exp = exp_by_cat.sum()
+
+                k1, k2, k3, k4 = st.columns(4)
+                k1.metric(f"Income ({time_range})", f"${p_inc:,.0f}")
+                k2.metric(f"Expenses ({time_range})", f"${p_exp:,.0f}")
+                k3.metric("Total Savings", f"${total_sav:,.0f}") 
+                k4.metric("Current Balance", f"${current_bal:,.0f}", delta_color="normal")
+            st.markdown("<br>", unsafe_allow_html=True)
+
+            if not rollup_df.empty:
+                c_left, c_right = st.columns([2, 1])
+                with c_left, span("activity"):
+                    st.subheader("Activity")
+                    with span("activity_figure"):
+                        if start_day is not None and start_day == end_day:
+                            trend = totals_by(rollup_df, 'type').rename('amount').reset_index()
+                            fig = px.bar(trend, x='type', y='amount', color='type', 
+                                         color_discrete_map={'Income': '#30D158', 'Expense': '#FF453A', 'Withdrawal': '#FF9F0A', 'Savings': '#0A84FF'})
+                        else:
+                            span_days = (end_day - start_day).days + 1 if start_day and end_day else None
+                            trend = activity_trend(rollup_df, span_days)
+                            fig = px.bar(trend, x='label', y='amount', color='type', barmode='group',
+                                         color_discrete_map={'Income': '#30D158', 'Expense': '#FF453A', 'Withdrawal': '#FF9F0A'})
                 
-                fig.update_layout(plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#FAFAFA'), xaxis=dict(showgrid=False, title=""), yaxis=dict(showgrid=True, gridcolor='#333333', title=""), legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, title=""), margin=dict(t=30, l=0, r=0, b=0), height=300)
-                st.plotly_chart(fig, use_container_width=True)
-
-            with c_right:
-                st.subheader("Breakdown")
-                df_exp_period = filtered_df[filtered_df['type'].isin(['Expense', 'Bill', 'Debt', 'Withdrawal'])]
-                if not df_exp_period.empty:
-                    fig_pie = px.pie(df_exp_period, values='amount', names='category', hole=0.7, color_discrete_sequence=['#0A84FF', '#5E5CE6', '#BF5AF2', '#FF375F', '#FF9F0A', '#FFD60A'])
-                    fig_pie.update_layout(showlegend=False, margin=dict(t=0, b=0, l=0, r=0), height=200, plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', annotations=[dict(text=f"${p_exp:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False, font=dict(color="#FAFAFA"))])
-                    st.plotly_chart(fig_pie, use_container_width=True)
-                else:
-                    st.caption("No expenses in this period.")
-                    
-                if not goals_df.empty:
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    if time_range == "This Month":
-                        st.subheader("Monthly Goals")
+                        fig.update_layout(plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#FAFAFA'), xaxis=dict(showgrid=False, title=""), yaxis=dict(showgrid=True, gridcolor='#333333', title=""), legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, title=""), margin=dict(t=30, l=0, r=0, b=0), height=300)
+                    st.plotly_chart(fig, use_container_width=True)
+
+                with c_right, span("breakdown"):
+                    st.subheader("Breakdown")
+                    if not exp_by_cat.empty:
+                        fig_pie = px.pie(exp_by_cat.rename('amount').reset_index(), values='amount', names='category', hole=0.7, color_discrete_sequence=['#0A84FF', '#5E5CE6', '#BF5AF2', '#FF375F', '#FF9F0A', '#FFD60A'])
+                        fig_pie.update_layout(showlegend=False, margin=dict(t=0, b=0, l=0, r=0), height=200, plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', annotations=[dict(text=f"${p_exp:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False, font=dict(color="#FAFAFA"))])
+                        st.plotly_chart(fig_pie, use_container_width=True)
                     else:
-                        st.subheader(f"Goals (Scaled to View)")
+                        st.caption("No expenses in this period.")
                     
-                    outflow_period_mask = filtered_df['type'].isin(['Expense', 'Bill', 'Debt', 'Withdrawal'])
+                    with span("goals"):
+                        if not goals_df.empty:
+                            st.markdown("<br>", unsafe_allow_html=True)
+                            if time_range == "This Month":
+                                st.subheader("Monthly Goals")
+                            else:
+                                st.subheader(f"Goals (Scaled to View)")
                     
-                    for _, row in goals_df.iterrows():
-                        cat = row['category']
-                        goal_amount = row['amount']
-                        goal_period = row['period'] if 'period' in row else 'Monthly'
-                        
-                        # Normalize goal to Daily then to View
-                        if goal_period == "Daily":
-                            base_daily = goal_amount
-                        elif goal_period == "Yearly":
-                            base_daily = goal_amount / 365.0
-                        else: # Monthly
-                            base_daily = goal_amount / 30.0
-                            
-                        # Calculate Limit for the CURRENT VIEW
-                        limit = base_daily * view_days
-                        
-                        spent = filtered_df[(filtered_df['category'] == cat) & outflow_period_mask]['amount'].sum()
-                        
-                        ratio = spent / limit if limit > 0 else 0
-                        pct = min(ratio * 100, 100)
-                        
-                        if ratio >= 1.0: bar_color = "#FF453A"
-                        elif ratio >= 0.75: bar_color = "#FFD60A"
-                        else: bar_color = "#30D158"
-
-                        st.markdown(f"""<div style="margin-bottom: 5px; display: flex; justify-content: space-between; font-size: 14px; color: #A0A0A0;"><span>{cat} ({goal_period} Goal)</span><span>${spent:,.0f} / ${limit:,.0f} (View)</span></div><div style="background-color: #2C2C2E; border-radius: 10px; height: 8px; width: 100%;"><div style="background-color: {bar_color}; width: {pct}%; height: 100%; border-radius: 10px;"></div></div><br>""", unsafe_allow_html=True)
+                            progress = goal_progress(goals_df, exp_by_cat, view_days)
+                            for cat, goal_period, spent, limit, pct, bar_color in progress[['category', 'period', 'spent', 'limit', 'pct', 'color']].itertuples(index=False):
+                                st.markdown(f"""<div style="margin-bottom: 5px; display: flex; justify-content: space-between; font-size: 14px; color: #A0A0A0;"><span>{cat} ({goal_period} Goal)</span><span>${spent:,.0f} / ${limit:,.0f} (View)</span></div><div style="background-color: #2C2C2E; border-radius: 10px; height: 8px; width: 100%;"><div style="background-color: {bar_color}; width: {pct}%; height: 100%; border-radius: 10px;"></div></div><br>""", unsafe_allow_html=True)
+            else:
+                st.info(f"No records found for {time_range}.")
+
+            st.markdown("---")
+            forecast_view()
+
+            st.markdown("---")
+            st.subheader("All Transactions")
+            grid_view(start_day, end_day)
+    fragment_timing(own_trace)
+
+@st.fragment
+def forecast_view():
+    # The horizon picker reruns only the forecast; the projection is cached per data version
+    with section("forecast", debug_panel, **trace_meta()) as own_trace:
+        uid = st.session_state.user_id
+        c_head, c_horizon = st.columns([3, 1])
+        c_head.subheader("Forecast")
+        months = c_horizon.selectbox("Horizon", FORECAST_HORIZONS, index=1, key="forecast_months", label_visibility="collapsed", format_func=lambda m: f"Next {m} months")
+        forecast = get_forecast(uid, months)
+        recurring, projected = forecast['recurring'], forecast['months']
+
+        if recurring.empty:
+            st.caption("No recurring income, bills or debt payments detected yet. Three or more at a steady interval make a series.")
         else:
-            st.info(f"No records found for {time_range}.")
-
-        st.markdown("---")
-        st.subheader("All Transactions")
-        
-        if not df.empty:
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button("Download CSV", data=csv, file_name="budget_data.csv", mime="text/csv")
-
-        if not filtered_df.empty:
-            grid_df = filtered_df[['id', 'date', 'description', 'category', 'amount', 'type']]
-            st.dataframe(
-                grid_df,
-                hide_index=True,
-                column_config={
-                    "id": st.column_config.NumberColumn("ID", width="small"),
-                    "date": st.column_config.DateColumn("Date", format="MMM DD"),
-                    "amount": st.column_config.NumberColumn("Amount", format="$%d"),
-                    "type": st.column_config.TextColumn("Type"),
-                },
-                use_container_width=True,
-                height=400 
-            )
+            with span("forecast_figure"):
+                lines = projected.melt(id_vars='month', value_vars=['balance', 'balance_after_goals'], var_name='line', value_name='amount')
+                lines['line'] = lines['line'].map({'balance': "Recurring only", 'balance_after_goals': "After goal budgets"})
+                fig = px.line(lines, x='month', y='amount', color='line', markers=True,
+                              color_discrete_map={"Recurring only": '#30D158', "After goal budgets": '#0A84FF'})
+                fig.update_layout(plot_bgcolor='#1E1E1E', paper_bgcolor='#1E1E1E', font=dict(color='#FAFAFA'), xaxis=dict(showgrid=False, title=""), yaxis=dict(showgrid=True, gridcolor='#333333', title=""), legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, title=""), margin=dict(t=30, l=0, r=0, b=0), height=300)
+            st.plotly_chart(fig, use_container_width=True)
+            end = projected.iloc[-1]
+            st.caption(f"{len(recurring)} recurring series · ${projected['income'].mean():,.0f} in and ${projected['outflow'].mean():,.0f} out a month · "
+                       f"${end['balance_after_goals']:,.0f} by {end['month']:%b %Y} after goal budgets")
+            with st.expander("Recurring transactions"):
+                st.dataframe(
+                    recurring[['type', 'category', 'amount', 'interval_days', 'occurrences', 'last', 'next']],
+                    hide_index=True,
+                    column_config={
+                        "amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+                        "interval_days": st.column_config.NumberColumn("Every (days)", format="%.0f"),
+                        "last": st.column_config.DateColumn("Last", format="MMM DD YYYY"),
+                        "next": st.column_config.DateColumn("Next", format="MMM DD YYYY"),
+                    },
+                    use_container_width=True,
+                )
+                goals_used = forecast['goals']
+                if not goals_used.empty:
+                    st.caption("Goal budgets already committed to recurring bills: " + " · ".join(
+                        f"{cat} {share:.0%}" for cat, share in goals_used[['category', 'share']].itertuples(index=False)))
+    fragment_timing(own_trace)
+
+@st.fragment
+def grid_view(start_day, end_day):
+    # Filters and paging rerun only the grid, with the window the overview last passed in
+    with section("grid", debug_panel, **trace_meta()) as own_trace:
+        uid = st.session_state.user_id
+        user_cats = get_user_categories(uid)
+        # Exports are generated only when a button is clicked
+        c_csv, c_pq, _ = st.columns([1, 1, 4])
+        c_csv.download_button("Download CSV", data=lambda: export_bytes('csv', uid), file_name="budget_data.csv", mime="text/csv")
+        c_pq.download_button("Download Parquet", data=lambda: export_bytes('parquet', uid), file_name="budget_data.parquet", mime="application/octet-stream")
+
+        g_type, g_cat, g_sort, g_size = st.columns(4)
+        grid_type = g_type.selectbox("Type", ["All Types", "Income", "Expense", "Bill", "Debt", "Savings", "Withdrawal"], key="grid_type", label_visibility="collapsed")
+        grid_cat = g_cat.selectbox("Category", ["All Categories"] + user_cats, key="grid_cat", label_visibility="collapsed")
+        grid_sort = g_sort.selectbox("Sort", ["Newest first", "Oldest first"], key="grid_sort", label_visibility="collapsed")
+        grid_size = g_size.selectbox("Rows", [25, 50, 100, 250], index=1, key="grid_size", label_visibility="collapsed", format_func=lambda n: f"{n} per page")
+
+        grid_filters = dict(
+            start=start_day, end=end_day,
+            type_=None if grid_type == "All Types" else grid_type,
+            category=None if grid_cat == "All Categories" else grid_cat,
+        )
+        grid_columns = {
+            "id": st.column_config.NumberColumn("ID", width="small"),
+            "date": st.column_config.DateColumn("Date", format="MMM DD"),
+            "amount": st.column_config.NumberColumn("Amount", format="$%d"),
+            "type": st.column_config.TextColumn("Type"),
+        }
+        grid_q = st.text_input("Search", key="grid_q", placeholder='Search descriptions and categories, e.g. star* or "whole foods"', label_visibility="collapsed")
+
+        if grid_q:
+            # Search replaces paging: the best matches for the same filters, ranked by relevance
+            found = search_transactions(uid, grid_q, **grid_filters, limit=grid_size)
+            if not found.empty:
+                st.dataframe(
+                    found.drop(columns='rank'),
+                    hide_index=True,
+                    column_config=grid_columns,
+                    use_container_width=True,
+                    height=400
+                )
+                st.caption(f"{len(found)} best matches, most relevant first")
+            else:
+                st.caption(f"No transactions match “{grid_q}”.")
         else:
-            st.caption("No transactions available.")
+            # Each visited page is remembered by the cursor it starts after; any filter change starts over
+            grid_sig = (tuple(grid_filters.values()), grid_sort, grid_size)
+            if st.session_state.get("grid_sig") != grid_sig:
+                st.session_state.grid_sig = grid_sig
+                st.session_state.grid_cursors = [None]
+            cursors = st.session_state.grid_cursors
+
+            grid_df, next_cursor = get_transactions_page(uid, **grid_filters, after=cursors[-1], page_size=grid_size, newest_first=grid_sort == "Newest first")
+            grid_total = count_transactions(uid, **grid_filters)
+
+            if not grid_df.empty:
+                st.dataframe(
+                    grid_df,
+                    hide_index=True,
+                    column_config=grid_columns,
+                    use_container_width=True,
+                    height=400 
+                )
+                c_prev, c_page, c_next = st.columns([1, 4, 1])
+                # Callbacks move the cursor before the fragment reruns, so paging costs one grid run
+                c_prev.button("◀ Prev", disabled=len(cursors) == 1, use_container_width=True, on_click=cursors.pop)
+                c_page.caption(f"Page {len(cursors)} of {max(1, -(-grid_total // grid_size))} · {grid_total:,} transactions")
+                c_next.button("Next ▶", disabled=next_cursor is None, use_container_width=True, on_click=cursors.append, args=(next_cursor,))
+            else:
+                st.caption("No transactions available.")
+    fragment_timing(own_trace)
+
+if 'user_id' not in st.session_state: st.session_state.user_id = None
+
+if st.session_state.user_id is None:
+    login_view()
+else:
+    # The analytics stack loads on the first signed-in run, keeping the login page light
+    import pandas as pd
+    import plotly.express as px
+    from analytics import OUTFLOW_TYPES, FORECAST_HORIZONS, period_window, month_window, activity_trend, totals_by, goal_progress
+    from importer import import_file
+
+    with st.sidebar:
+        sidebar_view()
+    overview_view()
+
+run_trace = end_trace()
+if debug_panel and run_trace is not None:
+    timing_panel(run_trace)
@@ -0,0 +1,23 @@
+import pytest
+
+import db
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Points db at a fresh, unsharded file under tmp_path and returns the module."""
+    monkeypatch.setattr(db, 'DB_FILE', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(db, 'SHARDS', 0)
+    db.init_db()
+    yield db
+    for path in [p for p in db._pools if p.startswith(str(tmp_path))]:
+        db._pools.pop(path).close()
+    for path in [p for p in db._writers if p.startswith(str(tmp_path))]:
+        db._writers.pop(path)
+
+
+@pytest.fixture
+def user(database):
+    """A registered user's id."""
+    database.register_user('alice', 'secret')
+    return database.login_user('alice', 'secret')[0]
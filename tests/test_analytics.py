@@ -0,0 +1,81 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from analytics import RECURRING_COLUMNS, detect_recurring, project_cash_flow
+
+TODAY = date(2026, 1, 15)
+NO_GOALS = pd.DataFrame(columns=['category', 'amount', 'period'])
+
+
+def frame(rows):
+    df = pd.DataFrame(rows, columns=['type', 'category', 'amount', 'date'])
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def monthly(type_, category, amount, first, count):
+    start = pd.Timestamp(first)
+    return [(type_, category, amount, start + pd.DateOffset(months=i)) for i in range(count)]
+
+
+def test_detect_recurring_empty():
+    out = detect_recurring(frame([]), today=TODAY)
+    assert out.empty
+    assert list(out.columns) == RECURRING_COLUMNS
+
+
+def test_detect_recurring_monthly_bill():
+    tx = frame(monthly('Bill', 'Rent', 1200.0, '2025-09-01', 5) + [('Expense', 'Food', 12.5, '2026-01-03')])
+    out = detect_recurring(tx, today=TODAY)
+    assert len(out) == 1
+    series = out.iloc[0]
+    assert (series['category'], series['amount'], series['interval_months']) == ('Rent', 1200.0, 1)
+    assert series['last'] == pd.Timestamp('2026-01-01')
+    assert series['next'] == pd.Timestamp('2026-02-01')
+
+
+def test_detect_recurring_keeps_future_dated_series():
+    # Rent entered up to a year ahead is still a series, last seen on its latest date
+    tx = frame(monthly('Bill', 'Rent', 1200.0, '2025-10-01', 16))
+    out = detect_recurring(tx, today=TODAY)
+    assert len(out) == 1
+    assert out.iloc[0]['last'] == pd.Timestamp('2027-01-01')
+
+
+def test_project_cash_flow_empty():
+    recurring = detect_recurring(frame([]), today=TODAY)
+    projected = project_cash_flow(recurring, NO_GOALS, 500.0, months=3, today=TODAY)['months']
+    assert len(projected) == 3
+    assert (projected['net'] == 0).all()
+    assert (projected['balance'] == 500.0).all()
+
+
+def test_project_cash_flow_monthly_income():
+    recurring = detect_recurring(frame(monthly('Income', 'Salary', 3000.0, '2025-09-10', 5)), today=TODAY)
+    projected = project_cash_flow(recurring, NO_GOALS, 0.0, months=3, today=TODAY)['months']
+    # January's repeat was on the 10th (recorded), so repeats land in Feb and Mar
+    np.testing.assert_allclose(projected['income'], [0.0, 3000.0, 3000.0])
+    np.testing.assert_allclose(projected['balance'], [0.0, 3000.0, 6000.0])
+
+
+def test_project_cash_flow_series_recorded_past_horizon():
+    tx = frame(monthly('Bill', 'Rent', 1200.0, '2025-10-01', 16))
+    recurring = detect_recurring(tx, today=TODAY)
+    scheduled = tx[tx['date'] > pd.Timestamp(TODAY)]
+    projected = project_cash_flow(recurring, NO_GOALS, 10000.0, months=6, today=TODAY, scheduled=scheduled)['months']
+    # Nothing projected from the series itself; every month's rent comes from the recorded rows
+    np.testing.assert_allclose(projected['outflow'], [0.0] + [1200.0] * 5)
+    assert projected['balance'].iloc[-1] == 10000.0 - 5 * 1200.0
+
+
+def test_project_cash_flow_counts_scheduled_against_goals():
+    scheduled = frame([('Bill', 'Rent', 900.0, '2026-02-01'), ('Income', 'Bonus', 400.0, '2026-03-05')])
+    recurring = detect_recurring(frame([]), today=TODAY)
+    goals = pd.DataFrame({'category': ['Rent'], 'amount': [900.0], 'period': ['Monthly']})
+    forecast = project_cash_flow(recurring, goals, 0.0, months=3, today=TODAY, scheduled=scheduled)
+    projected = forecast['months']
+    np.testing.assert_allclose(projected['income'], [0.0, 0.0, 400.0])
+    np.testing.assert_allclose(projected['outflow'], [0.0, 900.0, 0.0])
+    assert forecast['goals'].iloc[0]['committed'] == 300.0
@@ -0,0 +1,118 @@
+import pytest
+
+from db import DERIVED_TRIGGERS, LEDGER_OUTFLOW_TYPES
+
+OUTFLOW = ', '.join(f"'{t}'" for t in LEDGER_OUTFLOW_TYPES)
+LIVE = "FROM transactions WHERE deleted_batch IS NULL"
+
+# Each derived table as stored, next to the same figures recomputed from live transactions
+CHECKS = {
+    'balances': (
+        "SELECT user_id, ROUND(income, 6), ROUND(outflow, 6), ROUND(savings, 6), tx_count FROM balances WHERE tx_count > 0 ORDER BY 1",
+        f"""SELECT user_id, ROUND(TOTAL(CASE WHEN type = 'Income' THEN amount ELSE 0 END), 6),
+                   ROUND(TOTAL(CASE WHEN type IN ({OUTFLOW}) THEN amount ELSE 0 END), 6),
+                   ROUND(TOTAL(CASE WHEN type = 'Savings' THEN amount ELSE 0 END), 6), COUNT(*)
+            {LIVE} GROUP BY 1 ORDER BY 1""",
+    ),
+    'daily_rollup': (
+        "SELECT user_id, day, type, category, ROUND(total, 6), count FROM daily_rollup ORDER BY 1, 2, 3, 4",
+        f"""SELECT user_id, substr(date, 1, 10), COALESCE(type, ''), COALESCE(category, ''), ROUND(TOTAL(amount), 6), COUNT(*)
+            {LIVE} AND date IS NOT NULL GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4""",
+    ),
+    # Names left at zero are kept on purpose, and last_used only ever moves forward
+    'categories': (
+        "SELECT user_id, type, name, usage_count FROM categories WHERE usage_count > 0 ORDER BY 1, 2, 3",
+        f"SELECT user_id, COALESCE(type, ''), COALESCE(category, ''), COUNT(*) {LIVE} GROUP BY 1, 2, 3 ORDER BY 1, 2, 3",
+    ),
+    'transactions_fts': (
+        "SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH 'owner : u1 OR owner : u2' ORDER BY 1",
+        f"SELECT id {LIVE} ORDER BY 1",
+    ),
+    # Versions are never removed, so every year with live rows must have one
+    'partition_versions': (
+        f"SELECT DISTINCT p.user_id, p.year FROM partition_versions p JOIN transactions t "
+        f"ON t.user_id = p.user_id AND substr(t.date, 1, 4) = p.year AND t.deleted_batch IS NULL ORDER BY 1, 2",
+        f"SELECT DISTINCT user_id, substr(date, 1, 4) {LIVE} AND date IS NOT NULL ORDER BY 1, 2",
+    ),
+}
+
+ROWS = [
+    (1, 'Income', 'Salary', 2500.0, '2024-01-01', 'ACME payroll'),
+    (1, 'Expense', 'Food', 12.25, '2024-01-01', 'Corner cafe'),
+    (1, 'Expense', 'Food', 7.5, '2024-01-02', 'Bakery'),
+    (1, 'Bill', 'Rent', 900.0, '2023-12-31', 'Landlord'),
+    (1, 'Savings', 'General', 100.0, '2024-02-03', 'Sweep'),
+    (1, 'Expense', 'Other', None, '2024-02-04', 'No amount'),
+    (1, 'Expense', 'Other', 4.0, None, 'Undated'),
+    (2, 'Income', 'Gift', 50.0, '2024-01-01', 'Birthday'),
+    (2, 'Debt', 'Loan', 75.0, '2024-03-01', 'Instalment'),
+]
+
+
+@pytest.fixture
+def ledger(database):
+    for name in ('alice', 'bob'):
+        database.register_user(name, 'secret')
+    with database.get_pool().transaction() as conn:
+        conn.executemany("INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)", ROWS)
+    return database
+
+
+def assert_consistent(db):
+    with db.get_pool().connection() as conn:
+        for name, (stored, recomputed) in CHECKS.items():
+            assert conn.execute(stored).fetchall() == conn.execute(recomputed).fetchall(), name
+
+
+def update(db, sql, params=()):
+    with db.get_pool().transaction() as conn:
+        return conn.execute(sql, params).rowcount
+
+
+def test_inserts(ledger):
+    assert_consistent(ledger)
+
+
+def test_delete_undo_and_purge(ledger):
+    assert ledger.delete_transactions_category(1, 'Food') == 2
+    assert_consistent(ledger)
+    assert ledger.delete_transactions_range(2, '2024-01-01', '2024-12-31') == 2
+    assert_consistent(ledger)
+    food = next(d for d in ledger.recent_deletions(1) if d['label'] == 'Category Food')
+    assert ledger.undo_deletion(1, food['id']) == 2
+    assert_consistent(ledger)
+    assert ledger.purge_deleted(older_than=0) == 2
+    assert_consistent(ledger)
+
+
+@pytest.mark.parametrize('sql', [
+    # Moving between rollup rows or categories, or rewriting indexed text, only
+    # comes out right when the old row leaves before the new one arrives
+    "UPDATE transactions SET amount = 1000.0 WHERE description = 'Landlord'",
+    "UPDATE transactions SET category = 'Groceries', date = '2024-01-05' WHERE description = 'Bakery'",
+    "UPDATE transactions SET type = 'Expense', category = 'Food' WHERE description = 'Sweep'",
+    "UPDATE transactions SET description = 'Corner coffee' WHERE description = 'Corner cafe'",
+    "UPDATE transactions SET date = NULL WHERE description = 'Birthday'",
+    "UPDATE transactions SET date = '2024-04-01', amount = 3.0 WHERE description = 'Undated'",
+    "UPDATE transactions SET amount = NULL WHERE description = 'Instalment'",
+    "UPDATE transactions SET user_id = 2 WHERE user_id = 1 AND type = 'Income'",
+])
+def test_updates(ledger, sql):
+    assert update(ledger, sql) == 1
+    assert_consistent(ledger)
+
+
+def test_updates_of_tombstoned_rows_are_not_counted(ledger):
+    ledger.delete_transactions_category(1, 'Food')
+    update(ledger, "UPDATE transactions SET amount = amount * 2, category = 'Dining' WHERE category = 'Food'")
+    assert_consistent(ledger)
+    ledger.undo_deletion(1, ledger.recent_deletions(1)[0]['id'])
+    assert_consistent(ledger)
+
+
+def test_update_triggers_remove_before_they_add(ledger):
+    # SQLite fires the most recently created trigger first; every pair relies on it
+    with ledger.get_pool().connection() as conn:
+        order = {name: rowid for rowid, name in conn.execute("SELECT rowid, name FROM sqlite_master WHERE type = 'trigger'")}
+    for name in [*DERIVED_TRIGGERS, 'categories', 'partitions']:
+        assert order[f'trg_{name}_update_old'] > order[f'trg_{name}_update_new'], name
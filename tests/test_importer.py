@@ -0,0 +1,197 @@
+import io
+
+import pandas as pd
+import pytest
+
+from importer import _parse_amount, import_file, normalize_chunk, read_ofx_chunks
+
+
+def csv(text):
+    return io.BytesIO(text.encode())
+
+
+def test_identical_rows_in_one_file_both_land(database, user):
+    statement = "Date,Description,Amount\n2024-01-05,Paren,(7.25)\n2024-01-05,Paren,(7.25)\n2024-01-06,Bus,-2.50\n"
+    report = import_file(user, csv(statement))
+    assert (report['inserted'], report['duplicates']) == (3, 0)
+    assert database.get_totals(user)['outflow'] == 17.0
+
+
+def test_reimport_only_adds_occurrences_beyond_existing_ones(database, user):
+    import_file(user, csv("Date,Description,Amount\n2024-01-05,Paren,(7.25)\n"))
+    report = import_file(user, csv("Date,Description,Amount\n2024-01-05,Paren,(7.25)\n2024-01-05,Paren,(7.25)\n"))
+    assert (report['inserted'], report['duplicates']) == (1, 1)
+    again = import_file(user, csv("Date,Description,Amount\n2024-01-05,Paren,(7.25)\n2024-01-05,Paren,(7.25)\n"))
+    assert (again['inserted'], again['duplicates']) == (0, 2)
+    assert database.get_totals(user)['count'] == 2
+
+
+DERIVED = {
+    'balances': "SELECT income, outflow, savings, tx_count FROM balances WHERE user_id = ?",
+    'daily_rollup': "SELECT day, type, category, total, count FROM daily_rollup WHERE user_id = ? ORDER BY 1, 2, 3",
+    'categories': "SELECT type, name, usage_count, last_used FROM categories WHERE user_id = ? ORDER BY 1, 2",
+    'partition_versions': "SELECT year FROM partition_versions WHERE user_id = ? ORDER BY 1",
+    'transactions_fts': "SELECT t.date, t.amount FROM transactions_fts f JOIN transactions t ON t.id = f.rowid "
+                        "WHERE transactions_fts MATCH 'owner : u' || ? ORDER BY 1, 2",
+}
+
+
+def derived(database, user_id):
+    with database.get_pool().connection() as conn:
+        return {name: conn.execute(sql, (user_id,)).fetchall() for name, sql in DERIVED.items()}
+
+
+def test_bulk_insert_matches_row_by_row_triggers(database, user):
+    database.register_user('bob', 'secret')
+    other = database.login_user('bob', 'secret')[0]
+    rows = [
+        ('Income', 'Salary', 3000.0, '2024-01-01', 'ACME payroll'),
+        ('Expense', 'Food', 12.5, '2024-01-01', 'Corner cafe'),
+        ('Expense', 'Food', 12.5, '2024-01-01', 'Corner cafe'),
+        ('Bill', 'Rent', 900.0, '2023-12-31', 'Landlord'),
+        ('Savings', 'General', None, '2024-02-03', 'Sweep'),
+        ('Expense', 'Other', 4.0, None, 'Undated'),
+    ]
+    with database.get_pool().transaction() as conn:
+        assert database.bulk_insert(conn, [(user, *row) for row in rows]) == len(rows)
+        for row in rows:
+            conn.execute("INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)",
+                         (other, *row))
+    assert derived(database, user) == derived(database, other)
+
+    # Released rows are ordinary live rows to the triggers from then on
+    for user_id in (user, other):
+        assert database.delete_transactions_category(user_id, 'Food') == 2
+    assert derived(database, user) == derived(database, other)
+    for user_id in (user, other):
+        assert database.undo_deletion(user_id, database.recent_deletions(user_id)[0]['id']) == 2
+    assert derived(database, user) == derived(database, other)
+    with database.get_pool().connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE deleted_batch IS NOT NULL").fetchone()[0] == 0
+
+@pytest.mark.parametrize('text, expected', [
+    ('12.50', 12.5),
+    ('-3', -3.0),
+    ('(12.00)', -12.0),
+    ('$1,234.50', 1234.5),
+    ('£ 7.25', 7.25),
+    ('(€1,000.50)', -1000.5),
+    (' -$40 ', -40.0),
+    ('', None),
+    ('n/a', None),
+    (None, None),
+])
+def test_parse_amount(text, expected):
+    parsed = _parse_amount(pd.Series([text], dtype=object)).iloc[0]
+    assert (pd.isna(parsed) if expected is None else parsed == expected)
+
+
+def test_normalize_chunk_signs_types_and_defaults():
+    raw = pd.DataFrame({
+        'Posting Date': ['2024-01-05', '2024-01-06', '2024-01-07'],
+        'Payee': [' Cafe ', None, 'Employer'],
+        'Amount': ['(4.50)', '-20', '$2,000.00'],
+        'Type': ['expense', 'Nonsense', None],
+    })
+    rows, rejected = normalize_chunk(raw)
+    assert rejected.empty
+    assert rows.to_dict('list') == {
+        'date': ['2024-01-05', '2024-01-06', '2024-01-07'],
+        'type': ['Expense', 'Expense', 'Income'],
+        'category': ['Other'] * 3,
+        'amount': [4.5, 20.0, 2000.0],
+        'description': ['Cafe', '', 'Employer'],
+    }
+
+
+def test_normalize_chunk_debit_and_credit_columns():
+    raw = pd.DataFrame({
+        'Date': ['2024-02-01', '2024-02-02', '2024-02-03'],
+        'Money Out': ['12.00', None, None],
+        'Money In': [None, '300.00', None],
+        'Category': ['Food', None, 'Misc'],
+    })
+    rows, rejected = normalize_chunk(raw)
+    assert list(rows['type']) == ['Expense', 'Income']
+    assert list(rows['amount']) == [12.0, 300.0]
+    assert list(rows['category']) == ['Food', 'Other']
+    assert list(rejected['reason']) == ['bad amount']
+
+
+def test_normalize_chunk_rejects_with_reasons():
+    raw = pd.DataFrame({'date': ['2024-13-40', '2024-01-01', 'soon'], 'amount': ['5', 'abc', 'x']})
+    rows, rejected = normalize_chunk(raw)
+    assert rows.empty
+    assert list(rejected['reason']) == ['bad date', 'bad amount', 'bad date']
+
+
+def test_normalize_chunk_date_format():
+    raw = pd.DataFrame({'Date': ['31/01/2024'], 'Amount': ['-1']})
+    rows, _ = normalize_chunk(raw, date_format='%d/%m/%Y')
+    assert list(rows['date']) == ['2024-01-31']
+
+
+def test_normalize_chunk_needs_amount_and_date():
+    with pytest.raises(ValueError, match='amount'):
+        normalize_chunk(pd.DataFrame({'date': ['2024-01-01'], 'memo': ['x']}))
+    with pytest.raises(ValueError, match='date'):
+        normalize_chunk(pd.DataFrame({'amount': ['1']}))
+
+
+SGML = b"""OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+
+<OFX>
+<BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240131120000[-5:EST]
+<TRNAMT>-42.10
+<NAME>GROCER
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20240201
+<TRNAMT>1500.00
+<NAME>
+<MEMO>Payroll
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240202
+<TRNAMT>-3.00
+<NAME>BUS
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<?OFX OFXHEADER="200" VERSION="220"?>
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+  <STMTTRN>
+    <TRNTYPE>DEBIT</TRNTYPE>
+    <DTPOSTED>20240131</DTPOSTED>
+    <TRNAMT>-42.10</TRNAMT>
+    <NAME>GROCER</NAME>
+  </STMTTRN>
+  <STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20240201</DTPOSTED><TRNAMT>1500.00</TRNAMT><MEMO>Payroll</MEMO></STMTTRN><STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20240202</DTPOSTED><TRNAMT>-3.00</TRNAMT><NAME>BUS</NAME></STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+@pytest.mark.parametrize('statement', [SGML, XML], ids=['sgml', 'xml'])
+def test_read_ofx_chunks(statement):
+    chunks = list(read_ofx_chunks(io.BytesIO(statement), chunk_size=2))
+    assert [len(c) for c in chunks] == [2, 1]
+    raw = pd.concat(chunks, ignore_index=True)
+    assert raw.to_dict('list') == {
+        'date': ['20240131', '20240201', '20240202'],
+        'amount': ['-42.10', '1500.00', '-3.00'],
+        'description': ['GROCER', 'Payroll', 'BUS'],
+    }
+    rows, rejected = normalize_chunk(raw)
+    assert rejected.empty
+    assert list(rows['date']) == ['2024-01-31', '2024-02-01', '2024-02-02']
+    assert list(rows['type']) == ['Expense', 'Income', 'Expense']
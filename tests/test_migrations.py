@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def legacy(tmp_path, monkeypatch):
+    """A pre-migrations file with one dated row and one row without a date, opened through db."""
+    path = str(tmp_path / 'budget_v3.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT)')
+    conn.execute('CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, type TEXT, category TEXT, amount REAL, date TEXT, description TEXT)')
+    conn.execute('CREATE TABLE goals (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category TEXT, amount REAL)')
+    conn.execute("INSERT INTO users (username, password) VALUES ('alice', ?)", (db.make_hash('secret'),))
+    conn.executemany(
+        "INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (1, ?, ?, ?, ?, ?)",
+        [('Income', 'Salary', 100.0, '2024-01-01', 'pay'), ('Expense', 'Food', 5.0, None, 'undated'), ('Bill', 'Rent', None, '2024-01-02', 'no amount')],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, 'DB_FILE', path)
+    monkeypatch.setattr(db, 'SHARDS', 0)
+    db.init_db()
+    yield db
+    db._pools.pop(path).close()
+    db._writers.pop(path, None)
+
+
+def rollup(db):
+    with db.get_pool().connection() as conn:
+        return conn.execute("SELECT day, type, total, count FROM daily_rollup ORDER BY day").fetchall()
+
+
+def test_undated_rows_migrate_and_stay_out_of_the_rollup(legacy):
+    assert rollup(legacy) == [('2024-01-01', 'Income', 100.0, 1), ('2024-01-02', 'Bill', 0.0, 1)]
+
+
+def test_undated_rows_can_be_added_and_removed(legacy):
+    with legacy.get_pool().transaction() as conn:
+        tx_id = conn.execute(
+            "INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (1, 'Expense', 'Food', 2.0, NULL, 'also undated')"
+        ).lastrowid
+    legacy.delete_transaction(tx_id, 1)
+    legacy.undo_deletion(1, legacy.recent_deletions(1)[0]['id'])
+    assert rollup(legacy) == [('2024-01-01', 'Income', 100.0, 1), ('2024-01-02', 'Bill', 0.0, 1)]
+
+
+def test_rows_without_an_amount_count_as_zero(legacy):
+    assert legacy.get_totals(1) == {'count': 3, 'income': 100.0, 'outflow': 5.0, 'savings': 0.0, 'balance': 95.0}
+    with legacy.get_pool().connection() as conn:
+        tx_id = conn.execute("SELECT id FROM transactions WHERE amount IS NULL").fetchone()[0]
+    legacy.delete_transaction(tx_id, 1)
+    assert legacy.get_totals(1)['count'] == 2
+    legacy.undo_deletion(1, legacy.recent_deletions(1)[0]['id'])
+    assert legacy.get_totals(1)['count'] == 3
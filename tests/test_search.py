@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from db import search_query
+
+NASTY = [
+    'coffee "',
+    '"unclosed phrase',
+    'say "hi',
+    '"',
+    '""',
+    '"" ""',
+    'a"b',
+    'star*',
+    '*',
+    '**',
+    'st*r',
+    '"star*"',
+    'AND',
+    'coffee AND',
+    'OR NOT AND',
+    'NEAR(coffee tea)',
+    '(',
+    ')',
+    '(coffee',
+    'coffee)',
+    '-',
+    '-coffee',
+    'coffee - tea',
+    'description : coffee',
+    'owner : u2',
+    '^coffee',
+    '{owner}: u2',
+    '+',
+    "o'brien",
+    'café  ',
+    '\t\n',
+]
+
+
+@pytest.mark.parametrize('text', NASTY)
+def test_search_query_is_always_a_valid_match(database, user, text):
+    match = search_query(text)
+    if match is None:
+        return
+    with database.get_pool().connection() as conn:
+        try:
+            conn.execute("SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?", (match,)).fetchall()
+        except sqlite3.OperationalError as e:
+            pytest.fail(f"{text!r} -> {match!r}: {e}")
+    assert database.search_transactions(user, text).empty
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', None),
+    (None, None),
+    ('  ', None),
+    ('"', None),
+    ('*', None),
+    ('coffee shop', '"coffee" "shop"'),
+    ('star*', '"star"*'),
+    ('"corner cafe" tip', '"corner cafe" "tip"'),
+    ('"star*"', '"star"'),
+    ('a"b', '"a""b"'),
+    ('AND coffee', '"AND" "coffee"'),
+    ('owner : u2', '"owner" ":" "u2"'),
+])
+def test_search_query(text, expected):
+    assert search_query(text) == expected
+
+
+def test_operators_in_user_text_stay_literal(database, user):
+    database.add_transaction(user, 'Expense', 'Food', 3.5, '2024-01-02', 'Coffee AND cake (large)')
+    database.add_transaction(user, 'Expense', 'Food', 2.0, '2024-01-03', 'Tea')
+    database.register_user('bob', 'secret')
+    other = database.login_user('bob', 'secret')[0]
+    database.add_transaction(other, 'Expense', 'Food', 9.0, '2024-01-03', 'Coffee')
+    assert list(database.search_transactions(user, 'coffee AND (large')['description']) == ['Coffee AND cake (large)']
+    assert database.search_transactions(user, 'coffee OR tea').empty
+    assert database.search_transactions(user, f'owner : u{other}').empty
+    assert list(database.search_transactions(user, 'cof*')['description']) == ['Coffee AND cake (large)']
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from sharding import split_database
+
+
+def settings(db, path):
+    with db.get_pool(path).connection() as conn:
+        return dict(conn.execute("SELECT key, value FROM settings"))
+
+
+def test_unsplit_database_refuses_shards_and_records_nothing(database, user, monkeypatch):
+    database.add_transaction(user, 'Income', 'Salary', 10.0, '2024-01-01', 'pay')
+    monkeypatch.setattr(database, 'SHARDS', 2)
+    database._migrated.clear()
+    with pytest.raises(RuntimeError, match="split it first"):
+        database.init_db()
+    assert 'shards' not in settings(database, database.DB_FILE)
+
+
+def test_split_then_start_sharded(database, user, monkeypatch):
+    database.add_transaction(user, 'Income', 'Salary', 10.0, '2024-01-01', 'pay')
+    copied = split_database(database.DB_FILE, 2)
+    assert sum(copied.values()) == 1
+    assert settings(database, database.DB_FILE)['shards'] == '2'
+
+    monkeypatch.setattr(database, 'SHARDS', 2)
+    database._migrated.clear()
+    database.init_db()
+    assert database.get_totals(user)['count'] == 1
+    with pytest.raises(RuntimeError):
+        split_database(database.DB_FILE, 2)
+
+
+def test_split_refuses_while_open_elsewhere(database, user):
+    database.add_transaction(user, 'Income', 'Salary', 10.0, '2024-01-01', 'pay')
+    other = sqlite3.connect(database.DB_FILE)
+    other.execute("SELECT COUNT(*) FROM transactions").fetchone()
+    try:
+        with pytest.raises(RuntimeError, match="open elsewhere"):
+            split_database(database.DB_FILE, 2)
+    finally:
+        other.close()
+    assert database.get_totals(user)['count'] == 1
@@ -0,0 +1,89 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+INSERT = "INSERT INTO transactions (user_id, type, category, amount, date, description) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def grouped(database, user):
+    """Runs callables through the writer so that all of them share one commit.
+
+    The file's write lock is held elsewhere while a first write takes the
+    writer's thread into BEGIN; the calls queue up behind it and go out as
+    the next group once the lock is released. Returns each call's result or
+    exception, in order.
+    """
+    writer = database.get_writer()
+
+    def run(*calls):
+        blocker = sqlite3.connect(database.DB_FILE, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        with ThreadPoolExecutor(len(calls) + 1) as executor:
+            first = executor.submit(database.add_transaction, user, 'Income', 'Salary', 100.0, '2024-01-01', 'first')
+            wait_for(lambda: writer._queue.qsize() == 0 and not first.done())
+            futures = [executor.submit(call) for call in calls]
+            wait_for(lambda: writer._queue.qsize() == len(calls))
+            batches = writer.stats()['batches']
+            blocker.execute("ROLLBACK")
+            blocker.close()
+            first.result()
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
+        assert writer.stats()['batches'] == batches + 2
+        assert writer.stats()['max_batch'] == len(calls)
+        return outcomes
+
+    return run
+
+
+def live_descriptions(database):
+    with database.get_pool().connection() as conn:
+        return sorted(r[0] for r in conn.execute("SELECT description FROM transactions WHERE deleted_batch IS NULL"))
+
+
+def test_submit_returns_the_committed_row_id(database, user):
+    row_id, rowcount = database.get_writer().submit(INSERT, (user, 'Expense', 'Food', 4.5, '2024-01-02', 'lunch'))
+    assert rowcount == 1
+    # Committed by the time submit returns: a fresh connection sees it
+    conn = sqlite3.connect(database.DB_FILE)
+    assert conn.execute("SELECT description FROM transactions WHERE id = ?", (row_id,)).fetchone() == ('lunch',)
+    conn.close()
+
+
+def test_a_failing_write_only_fails_its_caller(database, user, grouped):
+    writer = database.get_writer()
+    before = writer.stats()
+    ok, failed, also_ok = grouped(
+        lambda: writer.submit(INSERT, (user, 'Expense', 'Food', 1.0, '2024-01-02', 'before')),
+        lambda: writer.submit("INSERT INTO no_such_table VALUES (1)"),
+        lambda: writer.submit(INSERT, (user, 'Expense', 'Food', 2.0, '2024-01-02', 'after')),
+    )
+    assert isinstance(failed, sqlite3.OperationalError)
+    assert ok[1] == also_ok[1] == 1 and ok[0] < also_ok[0]
+    assert live_descriptions(database) == ['after', 'before', 'first']
+    stats = writer.stats()
+    assert stats['errors'] - before['errors'] == 1
+    assert stats['writes'] - before['writes'] == 3
+
+
+def test_guarded_writes_in_one_group_cannot_overdraw(database, user, grouped):
+    # The fixture's first write leaves a balance of 100
+    spend = lambda label: database.add_transaction_if_funds(user, 'Expense', 'Food', 60.0, '2024-01-02', label)
+    outcomes = grouped(lambda: spend('a'), lambda: spend('b'))
+    assert sorted(outcome is None for outcome in outcomes) == [False, True]
+    assert database.get_totals(user)['balance'] == 40.0
+    assert database.get_writer().stats()['rejected'] == 1
@@ -0,0 +1,131 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Longest the first write of a group waits for others to share its commit
+WINDOW_S = 0.002
+MAX_BATCH = 256
+
+
+class GroupCommitWriter:
+    """A background thread that commits queued single-statement writes to one database file in groups.
+
+    Sessions call ``submit()``, which blocks until the write is committed and
+    returns (lastrowid, rowcount), so a caller that then reads sees its own
+    write. The thread takes everything queued while the last commit ran,
+    lingering up to WINDOW_S until the group is as large as the last one
+    (so a lone writer never waits), and commits up to MAX_BATCH as one
+    transaction: the commit is paid once per group instead of once per
+    form submit. There is one writer per file (db.get_writer), so a shard
+    whose write lock is held elsewhere only holds up its own users.
+    Each write runs under its own savepoint: a failing statement raises in
+    its caller and the rest of the group still commits.
+    """
+
+    def __init__(self, path, pool_for, window=WINDOW_S, max_batch=MAX_BATCH):
+        self.path = path
+        self._pool_for = pool_for
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._last_batch = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'writes': 0,
+            'rejected': 0,
+            'batches': 0,
+            'errors': 0,
+            'max_batch': 0,
+            'commit_s': 0.0,
+            'commit_max_s': 0.0,
+            'wait_s': 0.0,
+            'wait_max_s': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=f"db-writer:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=()):
+        """Queues one statement; returns (lastrowid, rowcount) once committed."""
+        future = Future()
+        self._queue.put((sql, params, future, time.perf_counter()))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Writers that shared the last commit are likely on their way back;
+            # wait for them (at most WINDOW_S) but not for anyone beyond them
+            expected = self._last_batch
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                left = deadline - time.perf_counter()
+                try:
+                    if left > 0 and len(batch) < expected:
+                        batch.append(self._queue.get(timeout=left))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._last_batch = len(batch)
+            self._commit(batch)
+
+    def _commit(self, items):
+        t0 = time.perf_counter()
+        results = []
+        try:
+            with self._pool_for(self.path).transaction() as conn:
+                for sql, params, _, _ in items:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        cur = conn.execute(sql, params)
+                        results.append((cur.lastrowid if cur.rowcount > 0 else None, cur.rowcount))
+                    except sqlite3.Error as e:
+                        conn.execute("ROLLBACK TO write")
+                        results.append(e)
+                    conn.execute("RELEASE write")
+        except BaseException as e:
+            # BEGIN or COMMIT failed: nothing in this group was written
+            results = [e] * len(items)
+        done = time.perf_counter()
+        committed = done - t0
+        waits = [done - queued_at for *_, queued_at in items]
+        failed = sum(isinstance(r, BaseException) for r in results)
+        # Guarded inserts (add_transaction_if_funds) that matched no row committed nothing
+        rejected = sum(not isinstance(r, BaseException) and r[1] == 0 for r in results)
+        with self._lock:
+            s = self._stats
+            s['writes'] += len(items) - failed - rejected
+            s['rejected'] += rejected
+            s['errors'] += failed
+            s['batches'] += 1
+            s['max_batch'] = max(s['max_batch'], len(items))
+            s['commit_s'] += committed
+            s['commit_max_s'] = max(s['commit_max_s'], committed)
+            s['wait_s'] += sum(waits)
+            s['wait_max_s'] = max(s['wait_max_s'], max(waits))
+        for (_, _, future, _), result in zip(items, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        submitted = s['writes'] + s['rejected'] + s['errors']
+        return {
+            'queue_depth': self._queue.qsize(),
+            'writes': s['writes'],
+            'rejected': s['rejected'],
+            'errors': s['errors'],
+            'batches': s['batches'],
+            'avg_batch': submitted / s['batches'] if s['batches'] else 0.0,
+            'max_batch': s['max_batch'],
+            'commit_ms_avg': s['commit_s'] / s['batches'] * 1000 if s['batches'] else 0.0,
+            'commit_ms_max': s['commit_max_s'] * 1000,
+            'wait_ms_avg': s['wait_s'] / submitted * 1000 if submitted else 0.0,
+            'wait_ms_max': s['wait_max_s'] * 1000,
+        }